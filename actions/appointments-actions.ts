@@ -14,12 +14,12 @@ async function decryptAppointement<T extends Appointment>(appointment: T) {
     }
   })
   if (!patient) throw new Error("Patient not found")
-  const decryptedNotes = await IBE.dechiffrer(appointment.notes!, patient.ibe_r!, patient.ibe_a!)
-  const decryptedDescription = await IBE.dechiffrer(appointment.description!, patient.ibe_r!, patient.ibe_a!)
+  const decrypted = await IBE.dechiffrerLot([appointment.notes!, appointment.description!], patient.ibe_r!, patient.ibe_a!)
+  const [notes, description] = decrypted.messages_clairs
   return {
     ...appointment,
-    notes: decryptedNotes.message_clair,
-    description: decryptedDescription.message_clair
+    notes,
+    description
   }
 }
 
@@ -46,12 +46,28 @@ export async function encryptData<T extends Policies, G extends keyof typeof sta
     return encrypted.encrypted_data
 }
 
+export async function encryptRow<T extends Policies>(table: T, fields: Partial<Record<SubPolicies<T>, string>>, service?: string): Promise<Record<SubPolicies<T>, string>> {
+    const encrypted = await ABE.encryptRow(table, fields as Record<string, string>, service)
+    return encrypted.encrypted_data as Record<SubPolicies<T>, string>
+}
+
 export async function decryptTable<T extends { id: string, abe_user_key: string | null }, G extends (keyof T) & string>(table: T, fields: G[], key: string) {
-    const newTable = {
-        ...table
-    }
-    for (const field of fields) {
-        newTable[field] = (await ABE.decrypt(table[field] as string, key)).decrypted_data as T[G]
-    }
-    return newTable
+    return (await decryptTables([table], fields, key))[0]
+}
+
+export async function decryptTables<T extends { id: string, abe_user_key: string | null }, G extends (keyof T) & string>(tables: T[], fields: G[], key: string) {
+    if (tables.length == 0) return []
+    const encrypted = tables.flatMap((table) => fields.map((field) => table[field] as string))
+    const { results } = await ABE.decryptBatch(encrypted, key)
+    return tables.map((table, i) => {
+        const newTable = {
+            ...table
+        }
+        fields.forEach((field, j) => {
+            const result = results[i * fields.length + j]
+            if ("error" in result) throw new Error(result.error)
+            newTable[field] = result.decrypted_data as T[G]
+        })
+        return newTable
+    })
 }
\ No newline at end of file
@@ -8,7 +8,7 @@ import { saltAndHashPassword } from "@/lib/password"
 import { IBE } from "@/crypt/ibe"
 import { authWrapper } from "./auth-wrapper"
 import { ABE } from "@/crypt/abe"
-import { encryptData } from "./encrypt"
+import { encryptRow } from "./encrypt"
 
 // TEL, EMAIL, ADDRESS (RECEPTION)
 
@@ -66,12 +66,17 @@ export async function addPatient({ patient, password }: { patient: Patient, pass
         role: "patient",
       }
     })
+    const encrypted = await encryptRow("PATIENT", {
+      email: patient.email!,
+      telephone: patient.contact,
+      address: patient.address!,
+    })
     const newPatient = await tx.patient.create({
       data: {
         ...patient,
-        email: await encryptData("PATIENT", "email", patient.email!),
-        contact: await encryptData("PATIENT", "telephone", patient.contact),
-        address: await encryptData("PATIENT", "address", patient.address!),
+        email: encrypted.email,
+        contact: encrypted.telephone,
+        address: encrypted.address,
         userId: user.id,
       },
     })
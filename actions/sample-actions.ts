@@ -5,7 +5,7 @@ import { requireAuth } from "./auth-actions"
 import { Prisma } from "@prisma/client"
 import { Sample } from "../lib/database/types"
 import { authWrapper } from "./auth-wrapper"
-import { decryptTable } from "./encrypt"
+import { decryptTable, decryptTables } from "./encrypt"
 import { ABE } from "@/crypt/abe"
 
 export const getSamples = authWrapper(async (session) => {
@@ -28,7 +28,7 @@ export const getSamples = authWrapper(async (session) => {
       },
     }
   })
-  return Promise.all(samples.map(async (sample) => decryptTable(sample, ["temperature", "observation", "heartRate", "bloodPressure"], user!.abe_user_key!)))
+  return decryptTables(samples, ["temperature", "observation", "heartRate", "bloodPressure"], user!.abe_user_key!)
 })
 
 export async function addSample(sample:Sample) {
@@ -7,7 +7,7 @@ import { saltAndHashPassword } from "@/lib/password"
 import { Staff } from "@/lib/database/types"
 import { authWrapper } from "./auth-wrapper"
 import { ABE } from "@/crypt/abe"
-import { decryptTable, encryptData } from "./encrypt"
+import { decryptTable, decryptTables, encryptData } from "./encrypt"
 
 const roles: { [key: string]: any } = {
   "admin": "AGENT",
@@ -26,9 +26,7 @@ export const getStaff = authWrapper(async (session) => {
   })
   if (session.role == "admin" || session.role == "reception") {
     const staff = await prisma.staff.findMany()
-    return await Promise.all(staff.map((s) => {
-      return decryptTable(s, ["email", "contact"], user?.abe_user_key!)
-    }))
+    return await decryptTables(staff, ["email", "contact"], user?.abe_user_key!)
   }
   else {
     const st = await prisma.staff.findUnique({
@@ -1,9 +1,18 @@
+import struct
 import hashlib
+import threading
+from collections import deque
 from typing import Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
+from functools import lru_cache
 from Cryptodome.Cipher import AES
 from Cryptodome.Util.Padding import pad, unpad
-from Cryptodome.Util.number import getPrime, isPrime, getRandomRange
+from Cryptodome.Util.number import getRandomNBitInteger, getRandomRange
+
+import arith
+import primes
+import stream as aead_stream
+from cache import LRUCache
 
 # === STRUCTURES DE DONNEES ===
 @dataclass
@@ -24,6 +33,53 @@ class PolicyNode:
         if self.attribute:
             self.attribute = self.attribute.upper()
 
+class FixedBase:
+    """Exponentiation à base fixe par fenêtres : base^e avec ~|q|/w multiplications"""
+
+    def __init__(self, base: int, p: int, q: int, window: int = 6):
+        self.p = arith.mpz(p)
+        self.q = q
+        self.window = window
+        # table[i][d] = base^(d * 2^(w*i)) mod p
+        self.table = []
+        b = arith.mpz(base)
+        for _ in range((q.bit_length() + window - 1) // window):
+            row = [arith.mpz(1)]
+            for _ in range((1 << window) - 1):
+                row.append(row[-1] * b % self.p)
+            self.table.append(row)
+            b = row[-1] * b % self.p
+
+    def pow(self, e: int) -> int:
+        """Calcule base^e mod p (la base est dans le sous-groupe d'ordre q)"""
+        e = arith.mpz(e % self.q)
+        mask = (1 << self.window) - 1
+        result = arith.mpz(1)
+        for row in self.table:
+            if not e:
+                break
+            digit = e & mask
+            if digit:
+                result = result * row[digit] % self.p
+            e >>= self.window
+        return int(result)
+
+class FixedBaseTables:
+    """Tables à base fixe pour g, g^α, h et e(g,g)^α d'une clé maîtresse"""
+
+    def __init__(self, mpk: 'MasterKey', window: int = 6):
+        self.g = FixedBase(mpk.g, mpk.p, mpk.q, window)
+        self.g_a = FixedBase(mpk.g_a, mpk.p, mpk.q, window)
+        self.h = FixedBase(mpk.h, mpk.p, mpk.q, window)
+        self.e_gg_alpha = FixedBase(mpk.e_gg_alpha, mpk.p, mpk.q, window)
+        self._h_alpha = {}
+
+    def h_alpha(self, alpha: int) -> int:
+        """h^α, constant pour toute la durée de vie de la clé maîtresse"""
+        if alpha not in self._h_alpha:
+            self._h_alpha[alpha] = self.h.pow(alpha)
+        return self._h_alpha[alpha]
+
 @dataclass 
 class MasterKey:
     g: int  # Générateur
@@ -33,34 +89,266 @@ class MasterKey:
     p: int  # Nombre premier
     q: int  # Ordre du sous-groupe
 
+    @property
+    def tables(self) -> FixedBaseTables:
+        """Tables de précalcul, construites au premier usage (ou via precompute)"""
+        if self.__dict__.get('_tables') is None:
+            self.precompute()
+        return self._tables
+
+    def precompute(self, window: int = 6) -> FixedBaseTables:
+        """Construit les tables à base fixe (à appeler au chargement de la clé)"""
+        self._tables = FixedBaseTables(self, window)
+        return self._tables
+
+    def __getstate__(self):
+        # Les tables ne sont jamais sérialisées : elles se reconstruisent à partir des paramètres
+        state = self.__dict__.copy()
+        state.pop('_tables', None)
+        return state
+
 @dataclass
 class UserKey:
     K: int  # g^(α + βt)
     L: int  # g^t
     attrs: Dict[str, int]  # {attribut: D = g^(t/r)}
 
+# Session de chiffrement précalculée : (s, C = g^s, C_tilde = g^(αs), clé AES dérivée de e(g,g)^(αs))
+Session = Tuple[int, int, int, bytes]
+
+class SessionPool:
+    """Pool borné de sessions de chiffrement, rempli en tâche de fond (phase hors ligne)"""
+
+    def __init__(self, cpabe: 'CPABE', mpk: MasterKey, size: int = 256, low_water: Optional[int] = None):
+        self.cpabe = cpabe
+        self.mpk = mpk
+        self.size = size
+        self.low_water = size // 2 if low_water is None else low_water
+        self.hits = 0
+        self.misses = 0
+        self._sessions = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._refill, name="cpabe-session-pool", daemon=True)
+        self._thread.start()
+
+    def _refill(self):
+        """Attend que le pool passe sous le seuil bas, puis le remplit jusqu'à size"""
+        while True:
+            with self._cond:
+                while not self._stopped and len(self._sessions) >= self.low_water:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+            while not self._stopped and len(self._sessions) < self.size:
+                self._sessions.append(self.cpabe.new_session(self.mpk))
+
+    def take(self) -> Optional[Session]:
+        """Retire une session précalculée (None si le pool est vide)"""
+        try:
+            session = self._sessions.popleft()
+            self.hits += 1
+        except IndexError:
+            session = None
+            self.misses += 1
+        if len(self._sessions) < self.low_water:
+            with self._cond:
+                self._cond.notify()
+        return session
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size': self.size,
+            'low_water': self.low_water,
+            'available': len(self._sessions),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def stop(self):
+        """Arrête le remplissage et attend la fin du fil (aucun fil actif ne doit subsister avant un fork)"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+# Plan de reconstruction : le secret vaut somme(coef * shares[attribut]) mod q
+Plan = List[Tuple[str, int]]
+
+class PolicyEvaluator:
+    """Évaluation compilée des politiques sur des masques de bits d'attributs.
+
+    Chaque attribut rencontré dans une politique reçoit un bit ; les attributs
+    d'une clé deviennent un entier. Pour une politique et la partie utile du
+    masque de la clé, un seul parcours donne soit un refus (uniquement des
+    opérations sur les bits), soit le plan de reconstruction le moins coûteux.
+    Les plans des politiques identifiées (policy_id) sont mémorisés.
+    """
+
+    def __init__(self, cpabe: 'CPABE', size: int = 4096):
+        self.cpabe = cpabe
+        self.size = size
+        self.bits: Dict[str, int] = {}
+        self._masks: Dict[str, int] = {}  # identifiant de politique -> masque de ses attributs
+        self._plans: Dict[tuple, Optional[Plan]] = {}  # (q, identifiant, masque utile) -> plan ou None
+        self._lagrange: Dict[tuple, List[int]] = {}  # (q, abscisses) -> coefficients de Lagrange en 0
+        self._lock = threading.Lock()
+
+    def mask(self, attrs) -> int:
+        """Masque des attributs déjà connus (les autres n'apparaissent dans aucune politique)"""
+        bits = self.bits
+        mask = 0
+        for attr in attrs:
+            bit = bits.get(attr)
+            if bit is not None:
+                mask |= bit
+        return mask
+
+    def plan(self, policy_id: Optional[str], policy: PolicyNode, attrs) -> Optional[Plan]:
+        """Plan de reconstruction pour ces attributs, ou None si la politique n'est pas satisfaite"""
+        if policy_id is None:
+            # Ancien chiffré sans identifiant : évaluation directe, sans mémorisation
+            policy_mask = self._policy_mask(policy)
+            return self._plan(policy, self.mask(attrs) & policy_mask)
+
+        policy_mask = self._masks.get(policy_id)
+        if policy_mask is None:
+            policy_mask = self._remember(self._masks, policy_id, self._policy_mask(policy))
+
+        key = (self.cpabe.q, policy_id, self.mask(attrs) & policy_mask)
+        plan = self._plans.get(key, False)
+        if plan is False:
+            plan = self._remember(self._plans, key, self._plan(policy, key[2]))
+        return plan
+
+    def _remember(self, memo: Dict, key, value):
+        # Mémoire bornée : vidée d'un coup quand elle est pleine
+        if len(memo) >= self.size:
+            memo.clear()
+        memo[key] = value
+        return value
+
+    def _policy_mask(self, node: PolicyNode) -> int:
+        if node.node_type == 'ATTR':
+            bit = self.bits.get(node.attribute)
+            if bit is None:
+                with self._lock:
+                    bit = self.bits.setdefault(node.attribute, 1 << len(self.bits))
+            return bit
+        mask = 0
+        for child in node.children:
+            mask |= self._policy_mask(child)
+        return mask
+
+    def _plan(self, node: PolicyNode, mask: int) -> Optional[Plan]:
+        if node.node_type == 'ATTR':
+            return [(node.attribute, 1)] if mask & self.bits[node.attribute] else None
+
+        elif node.node_type == 'AND':
+            plan = []
+            for child in node.children:
+                part = self._plan(child, mask)
+                if part is None:
+                    return None
+                plan.extend(part)
+            return plan
+
+        elif node.node_type == 'OR':
+            # Tous les enfants portent le même secret : le plus court suffit
+            candidates = [p for p in (self._plan(c, mask) for c in node.children) if p is not None]
+            return min(candidates, key=len) if candidates else None
+
+        elif node.node_type == 'THRESHOLD':
+            k = node.threshold[0]
+            satisfied = [(c, p) for c, p in ((c, self._plan(c, mask)) for c in node.children) if p is not None]
+            if len(satisfied) < k:
+                return None
+            # Les k enfants les moins coûteux, puis coefficients de Lagrange en 0
+            chosen = sorted(satisfied, key=lambda cp: len(cp[1]))[:k]
+            q = self.cpabe.q
+            coefs = self.lagrange(tuple(self.cpabe._hash_attr(c.attribute) for c, _ in chosen))
+            plan = []
+            for (_, part), coef in zip(chosen, coefs):
+                plan.extend((attr, c * coef % q) for attr, c in part)
+            return plan
+
+    def lagrange(self, xs: Tuple[int, ...]) -> List[int]:
+        """Coefficients de Lagrange en 0 pour ces abscisses, mémorisés par sous-ensemble"""
+        q = self.cpabe.q
+        key = (q, xs)
+        coefs = self._lagrange.get(key)
+        if coefs is None:
+            # λi = Π(j≠i) -xj / (xi - xj) : les k dénominateurs sont inversés en une fois
+            numerators, denominators = [], []
+            for i, xi in enumerate(xs):
+                num = den = 1
+                for j, xj in enumerate(xs):
+                    if i != j:
+                        num = num * -xj % q
+                        den = den * (xi - xj) % q
+                numerators.append(num)
+                denominators.append(den)
+            coefs = [n * d % q for n, d in zip(numerators, arith.batch_inverse(denominators, q))]
+            self._remember(self._lagrange, key, coefs)
+        return coefs
+
+def _zeroize(_, key: bytearray):
+    """Efface une clé dérivée retirée du cache"""
+    key[:] = bytes(len(key))
+
+def _purge_expired(cache: LRUCache, stop: threading.Event, period: float):
+    """Purge périodique des entrées expirées d'un cache, jusqu'à ce que stop soit levé"""
+    while not stop.wait(period):
+        cache.expire()
+
+# === RECHERCHE DE NOMBRES PREMIERS SURS ===
+def _sieve_safe_prime(bits: int) -> Optional[Tuple[int, int]]:
+    """Cherche p = 2q + 1 premier sûr (q de `bits` bits) dans une fenêtre de crible ; None si aucun"""
+    start = getRandomNBitInteger(bits) | 1
+    # Les candidats q sont criblés pour q et pour 2q + 1 avant tout test de primalité
+    for q in primes.sieve(start, 2, forms=((1, 0), (2, 1))):
+        if q.bit_length() != bits:
+            return None
+        if arith.is_prime(q) and arith.is_prime(2 * q + 1):
+            return 2 * q + 1, q
+    return None
+
 # === IMPLEMENTATION CP-ABE ===
 @dataclass
 class CPABE:
-    def __init__(self, security_param: int = 256):
-        self.security_param = security_param
-        self.p, self.q = self._generate_safe_prime()
-        self.g = self._find_generator()
+    def __init__(self, security_param: int = 256, p: Optional[int] = None, q: Optional[int] = None,
+                 g: Optional[int] = None, workers: int = 1):
+        """Sans p et q, génère de nouveaux paramètres (criblage réparti sur `workers` processus)"""
+        if p is not None and q is not None:
+            if p != 2 * q + 1:
+                raise ValueError("Paramètres invalides: p doit valoir 2q + 1")
+            self.security_param = q.bit_length()
+            self.p, self.q = p, q
+        else:
+            self.security_param = security_param
+            self.p, self.q = self._generate_safe_prime(workers)
+        self.g = g if g is not None else self._find_generator()
+        self.pool: Optional[SessionPool] = None  # Sessions précalculées (optionnel)
+        self.evaluator = PolicyEvaluator(self)
+        self.key_cache: Optional[LRUCache] = None  # Clés AES dérivées (optionnel, voir enable_key_cache)
+        self._key_cache_stop: Optional[threading.Event] = None
+        self._key_cache_purge: Optional[threading.Thread] = None
 
-    def _generate_safe_prime(self) -> Tuple[int, int]:
+    @classmethod
+    def from_params(cls, p: int, q: int, g: int, **kwargs) -> 'CPABE':
+        """Reconstruit un CPABE à partir de paramètres stockés, sans génération de nombres premiers"""
+        return cls(p=p, q=q, g=g, **kwargs)
+
+    def _generate_safe_prime(self, workers: int = 1) -> Tuple[int, int]:
         """Génère un nombre premier sûr p = 2q + 1"""
-        while True:
-            q = getPrime(self.security_param)
-            p = 2 * q + 1
-            if isPrime(p):
-                return p, q
+        return primes.search(_sieve_safe_prime, (self.security_param,), workers=workers)[0]
 
     def _find_generator(self) -> int:
         """Trouve un générateur du sous-groupe d'ordre q"""
         # On cherche un élément d'ordre q (car p = 2q + 1)
         for _ in range(100):
             h = getRandomRange(2, self.p-1)
-            g = pow(h, 2, self.p)
+            g = arith.powmod(h, 2, self.p)
             if g != 1:
                 return g
         raise ValueError("Générateur non trouvé")
@@ -70,9 +358,9 @@ class CPABE:
         alpha = getRandomRange(1, self.q-1)
         beta = getRandomRange(1, self.q-1)
         
-        g_a = pow(self.g, alpha, self.p)
-        h = pow(self.g, beta, self.p)
-        e_gg_alpha = pow(self.g, alpha * alpha, self.p)  # Simulation de e(g,g)^α
+        g_a = arith.powmod(self.g, alpha, self.p)
+        h = arith.powmod(self.g, beta, self.p)
+        e_gg_alpha = arith.powmod(self.g, alpha * alpha, self.p)  # Simulation de e(g,g)^α
         
         return (
             MasterKey(
@@ -88,26 +376,24 @@ class CPABE:
     
     def keygen(self, mpk: MasterKey, msk: Dict, attributes: List[str]) -> UserKey:
         """Génère une clé utilisateur basée sur ses attributs"""
+        # Attributs vérifiés avant tout calcul : la clé doit rester sérialisable
+        names = {check_attribute(attr.upper()) for attr in attributes}
         t = getRandomRange(1, self.q-1)
+        tables = mpk.tables
         
-        K = (pow(mpk.g_a, t, mpk.p) * pow(mpk.h, msk['alpha'], mpk.p)) % mpk.p
-        L = pow(mpk.g, t, mpk.p)
+        K = (tables.g_a.pow(t) * tables.h_alpha(msk['alpha'])) % mpk.p
+        L = tables.g.pow(t)
         
         # Génération des composantes pour chaque attribut
         attrs = {}
-        for attr in set(attributes):  # Éliminer les doublons
+        for attr in names:  # Doublons déjà éliminés
             r = getRandomRange(1, self.q-1)
-            attrs[attr.upper()] = pow(mpk.g, t * pow(r, -1, self.q), mpk.p)
+            attrs[attr] = tables.g.pow(t * arith.invert(r, self.q))
         
         return UserKey(K=K, L=L, attrs=attrs)
     
     def keygen2(self, mpk: MasterKey, msk: Dict, attributes: List[Union[str, List[str]]]) -> UserKey:
         """Génère une clé utilisateur basée sur ses attributs"""
-        t = getRandomRange(1, self.q-1)
-
-        K = (pow(mpk.g_a, t, mpk.p) * pow(mpk.h, msk['alpha'], mpk.p)) % mpk.p
-        L = pow(mpk.g, t, mpk.p)
-
         # Normalisation des attributs pour tout convertir en chaînes plates
         normalized_attributes = []
         for attr in attributes:
@@ -115,42 +401,225 @@ class CPABE:
                 normalized_attributes.extend(attr)
             else:  # Si c'est une simple chaîne, on la garde telle quelle
                 normalized_attributes.append(attr)
+        # Attributs vérifiés avant tout calcul : la clé doit rester sérialisable
+        names = {check_attribute(attr.upper()) for attr in normalized_attributes}
+
+        t = getRandomRange(1, self.q-1)
+        tables = mpk.tables
+
+        K = (tables.g_a.pow(t) * tables.h_alpha(msk['alpha'])) % mpk.p
+        L = tables.g.pow(t)
 
         # Génération des composantes pour chaque attribut
         attrs = {}
-        for attr in set(normalized_attributes):  # Éliminer les doublons
+        for attr in names:  # Doublons déjà éliminés
             r = getRandomRange(1, self.q-1)
-            attrs[attr.upper()] = pow(mpk.g, t * pow(r, -1, self.q), mpk.p)
+            attrs[attr] = tables.g.pow(t * arith.invert(r, self.q))
 
         return UserKey(K=K, L=L, attrs=attrs)
 
-    def encrypt(self, mpk: MasterKey, plaintext: bytes, policy: PolicyNode) -> Dict:
-        """Chiffre un message avec une politique d'accès"""
+    def new_session(self, mpk: MasterKey) -> Session:
+        """Phase hors ligne : tire s et calcule tout ce qui ne dépend que de s"""
         s = getRandomRange(1, self.q-1)
-        
-        # Chiffrement AES avec la clé dérivée de e(g,g)^(αs)
-        cipher_key = self._derive_key(pow(mpk.e_gg_alpha, s, mpk.p))
-        cipher = AES.new(cipher_key, AES.MODE_GCM)
-        ciphertext, tag = cipher.encrypt_and_digest(pad(plaintext, AES.block_size))
-        
-        return {
-            'policy': policy,
-            'C_tilde': pow(mpk.g_a, s, mpk.p),  # g^(αs)
-            'C': pow(mpk.g, s, mpk.p),         # g^s
+        tables = mpk.tables
+        return (
+            s,
+            tables.g.pow(s),                                 # g^s
+            tables.g_a.pow(s),                               # g^(αs)
+            self._derive_key(tables.e_gg_alpha.pow(s)),      # clé dérivée de e(g,g)^(αs)
+        )
+
+    def _take_session(self, mpk: MasterKey) -> Session:
+        """Prend une session dans le pool si possible, sinon la calcule immédiatement"""
+        session = None
+        if self.pool is not None and self.pool.mpk is mpk:
+            session = self.pool.take()
+        return session or self.new_session(mpk)
+
+    def encrypt(self, mpk: MasterKey, plaintext: bytes, policy: PolicyNode, policy_id: Optional[str] = None) -> Dict:
+        """Chiffre un message avec une politique d'accès"""
+        return self.encrypt_many(mpk, [plaintext], policy, policy_id)[0]
+
+    def encrypt_many(self, mpk: MasterKey, plaintexts: List[bytes], policy: PolicyNode, policy_id: Optional[str] = None) -> List[Dict]:
+        """Chiffre plusieurs champs d'une même ligne soumis à la même politique.
+
+        Une seule encapsulation (s, C, C_tilde, partage du secret) est calculée ;
+        chaque champ a son propre nonce et son propre tag AES-GCM.
+        Avec policy_id, le chiffré ne porte que l'identifiant de la politique
+        (à résoudre par un registre avant le déchiffrement) au lieu de l'arbre.
+        """
+        s, C, C_tilde, cipher_key = self._take_session(mpk)
+        shares = self._distribute_shares(s, policy)
+
+        ciphertexts = []
+        for plaintext in plaintexts:
+            # Chiffrement AES avec la clé dérivée de e(g,g)^(αs)
+            cipher = AES.new(cipher_key, AES.MODE_GCM)
+            ciphertext, tag = cipher.encrypt_and_digest(pad(plaintext, AES.block_size))
+            ciphertexts.append({
+                **({'policy_id': policy_id} if policy_id else {'policy': policy}),
+                'C_tilde': C_tilde,  # g^(αs)
+                'C': C,         # g^s
+                'shares': shares,
+                'ciphertext': ciphertext,
+                'iv': cipher.nonce,
+                'tag': tag
+            })
+        return ciphertexts
+
+    def encrypt_stream(self, mpk: MasterKey, chunks, policy: PolicyNode, policy_id: str,
+                       segment_size: int = aead_stream.SEGMENT_SIZE):
+        """Chiffre un flux d'octets par segments AES-GCM (STREAM), sans le garder en mémoire.
+
+        Produit l'en-tête (encapsulation ABE, une seule fois) puis les segments
+        au fur et à mesure de la lecture de chunks.
+        """
+        s, C, C_tilde, cipher_key = self._take_session(mpk)
+        header = {
+            'policy_id': policy_id,
+            'C_tilde': C_tilde,
+            'C': C,
             'shares': self._distribute_shares(s, policy),
-            'ciphertext': ciphertext,
-            'iv': cipher.nonce,
-            'tag': tag
         }
+        yield pack_stream_header(header, self.p)
+        yield from aead_stream.encrypt_stream(cipher_key, chunks, segment_size)
+
+    def decrypt_stream(self, mpk: MasterKey, sk: UserKey, header: Dict, stream,
+                       max_segment_size: int = aead_stream.SEGMENT_SIZE):
+        """Déchiffre les segments d'un flux dont l'en-tête a été lu par read_stream_header.
+
+        header doit porter l'arbre de la politique ('policy'). Chaque segment est
+        authentifié avant d'être rendu.
+        """
+        plan = self._plan(sk, header)
+        if plan is None:
+            raise ValueError("Accès refusé: les attributs ne satisfont pas la politique")
+        cipher_key = self._recover_key(mpk, header, plan)
+        yield from aead_stream.decrypt_stream(cipher_key, stream, max_segment_size)
+
+    def enable_key_cache(self, size: int, ttl: Optional[float] = None):
+        """Active le cache mémoire des clés AES dérivées, par (empreinte de l'en-tête, clé utilisateur).
+
+        Une entrée n'est créée qu'après un contrôle de politique réussi pour cette
+        clé utilisateur ; les clés sont effacées (mises à zéro) à l'éviction.
+        """
+        self.disable_key_cache()
+        self.key_cache = LRUCache(size, ttl, on_evict=_zeroize)
+        if ttl:
+            # Les entrées expirées sont aussi purgées sans trafic, au plus ttl/2 après leur expiration
+            self._key_cache_stop = threading.Event()
+            self._key_cache_purge = threading.Thread(
+                target=_purge_expired, args=(self.key_cache, self._key_cache_stop, ttl / 2),
+                name="abe-key-cache-purge", daemon=True)
+            self._key_cache_purge.start()
+
+    def disable_key_cache(self):
+        """Vide (en effaçant les clés) puis désactive le cache des clés dérivées"""
+        if self._key_cache_stop is not None:
+            self._key_cache_stop.set()
+            self._key_cache_purge.join()
+            self._key_cache_stop = self._key_cache_purge = None
+        if self.key_cache is not None:
+            self.key_cache.clear()
+            self.key_cache = None
+
+    def decrypt(self, mpk: MasterKey, sk: UserKey, ciphertext: Dict, user_tag: Optional[str] = None) -> bytes:
+        """Déchiffre le message si la politique est satisfaite.
 
-    def decrypt(self, mpk: MasterKey, sk: UserKey, ciphertext: Dict) -> bytes:
-        """Déchiffre le message si la politique est satisfaite"""
-        if not self._check_policy(ciphertext['policy'], sk.attrs):
+        user_tag identifie la clé utilisateur (poignée) pour le cache des clés dérivées.
+        """
+        cache_key = self._key_cache_entry(ciphertext, user_tag)
+        if cache_key is not None:
+            plaintext = self._open_cached(cache_key, ciphertext)
+            if plaintext is not None:
+                return plaintext
+        plan = self._plan(sk, ciphertext)
+        if plan is None:
             return "Accès refusé"
             raise ValueError("Accès refusé: les attributs ne satisfont pas la politique")
-            
+        return self._decrypt_authorized(mpk, ciphertext, plan, cache_key)
+
+    def decrypt_many(self, mpk: MasterKey, sk: UserKey, ciphertexts: List[Dict],
+                     user_tag: Optional[str] = None) -> List[Union[bytes, Exception]]:
+        """Déchiffre plusieurs chiffrés avec la même clé utilisateur.
+
+        La politique n'est évaluée qu'une fois par politique distincte ; chaque
+        élément donne soit le message clair, soit l'exception correspondante.
+        """
+        plans = {}
+        results = []
+        for ciphertext in ciphertexts:
+            cache_key = self._key_cache_entry(ciphertext, user_tag)
+            if cache_key is not None:
+                plaintext = self._open_cached(cache_key, ciphertext)
+                if plaintext is not None:
+                    results.append(plaintext)
+                    continue
+            policy_id = ciphertext.get('policy_id')
+            if policy_id is None:
+                plan = self._plan(sk, ciphertext)
+            elif policy_id in plans:
+                plan = plans[policy_id]
+            else:
+                plan = plans[policy_id] = self._plan(sk, ciphertext)
+            if plan is None:
+                results.append(ValueError("Accès refusé: les attributs ne satisfont pas la politique"))
+                continue
+            try:
+                results.append(self._decrypt_authorized(mpk, ciphertext, plan, cache_key))
+            except ValueError as e:
+                results.append(e)
+        return results
+
+    def _key_cache_entry(self, ciphertext: Dict, user_tag: Optional[str]) -> Optional[Tuple[bytes, str]]:
+        """Clé du cache des clés dérivées : empreinte de l'encapsulation et identité de l'utilisateur"""
+        if self.key_cache is None or not user_tag:
+            return None
+        h = hashlib.sha256()
+        h.update(str(ciphertext.get('policy_id') or repr(ciphertext['policy'])).encode())
+        h.update(b"%x:%x" % (ciphertext['C'], ciphertext['C_tilde']))
+        for name in sorted(ciphertext['shares']):
+            h.update(b"%s=%x" % (name.encode(), ciphertext['shares'][name]))
+        return h.digest(), user_tag
+
+    def _open_cached(self, cache_key: Tuple[bytes, str], ciphertext: Dict) -> Optional[bytes]:
+        """Déchiffrement avec une clé en cache ; None si absente ou si elle ne convient pas"""
+        cipher_key = self.key_cache.get(cache_key)
+        if cipher_key is None:
+            return None
+        try:
+            return self._open(cipher_key, ciphertext)
+        except ValueError:
+            # Entrée effacée entre-temps ou données altérées : retour au calcul complet
+            self.key_cache.pop(cache_key)
+            return None
+
+    def _plan(self, sk: UserKey, ciphertext: Dict) -> Optional[Plan]:
+        """Plan de reconstruction du secret pour cette clé, None si l'accès est refusé"""
+        return self.evaluator.plan(ciphertext.get('policy_id'), ciphertext['policy'], sk.attrs)
+
+    def _decrypt_authorized(self, mpk: MasterKey, ciphertext: Dict, plan: Plan,
+                            cache_key: Optional[Tuple[bytes, str]] = None) -> bytes:
+        """Déchiffre un chiffré dont la politique est satisfaite, selon son plan de reconstruction"""
+        cipher_key = self._recover_key(mpk, ciphertext, plan)
+        if cache_key is not None and self.key_cache is not None:
+            self.key_cache.put(cache_key, bytearray(cipher_key))
+        return self._open(cipher_key, ciphertext)
+
+    def _open(self, cipher_key, ciphertext: Dict) -> bytes:
+        """AES-GCM : vérifie le tag et retire le bourrage"""
+        try:
+            cipher = AES.new(cipher_key, AES.MODE_GCM, nonce=ciphertext['iv'])
+            return unpad(cipher.decrypt_and_verify(
+                ciphertext['ciphertext'], ciphertext['tag']
+            ), AES.block_size)
+        except ValueError as e:
+            raise ValueError("Échec du déchiffrement: la clé ou les données sont corrompues") from e
+
+    def _recover_key(self, mpk: MasterKey, ciphertext: Dict, plan: Plan) -> bytes:
+        """Clé AES d'un chiffré (ou d'un en-tête de flux) à partir du plan de reconstruction"""
         # Reconstruction du secret s
-        s = self._reconstruct_secret(ciphertext['policy'], ciphertext['shares'], sk)
+        s = self._apply_plan(plan, ciphertext['shares'])
         if s is None:
             raise ValueError("Impossible de reconstruire le secret")
         
@@ -158,18 +627,10 @@ class CPABE:
         # Dans une vraie implémentation CP-ABE, on utiliserait:
         # key = pairing(C_tilde, K) / pairing(L, C)
         # Mais ici on simule avec:
-        reconstructed_key = pow(mpk.e_gg_alpha, s, mpk.p)
+        reconstructed_key = mpk.tables.e_gg_alpha.pow(s)
         
         # Dérivation de la clé
-        cipher_key = self._derive_key(reconstructed_key)
-        
-        try:
-            cipher = AES.new(cipher_key, AES.MODE_GCM, nonce=ciphertext['iv'])
-            return unpad(cipher.decrypt_and_verify(
-                ciphertext['ciphertext'], ciphertext['tag']
-            ), AES.block_size)
-        except ValueError as e:
-            raise ValueError("Échec du déchiffrement: la clé ou les données sont corrompues") from e
+        return self._derive_key(reconstructed_key)
 
     # === METHODES UTILITAIRES ===
     def _derive_key(self, element: int) -> bytes:
@@ -204,78 +665,198 @@ class CPABE:
             # Polynôme de degré k-1
             coeffs = [secret] + [getRandomRange(1, self.q-1) for _ in range(k-1)]
             for child in policy.children:
-                x = self._hash_attr(child.attribute)
-                share = sum(c * pow(x, i, self.q) for i, c in enumerate(coeffs)) % self.q
+                x = arith.mpz(self._hash_attr(child.attribute))
+                # Évaluation par la méthode de Horner : k-1 produits, sans exponentiation
+                share = 0
+                for c in reversed(coeffs):
+                    share = (share * x + c) % self.q
+                share = int(share)
                 shares.update(self._distribute_shares(share, child))
                 
         return shares
 
-    def _reconstruct_secret(self, policy: PolicyNode, shares: Dict[str, int], sk: UserKey) -> Optional[int]:
-        """Reconstruit le secret ssi la politique est satisfaite"""
-        if policy.node_type == 'ATTR':
-            if policy.attribute in sk.attrs:
-                return shares.get(policy.attribute)
-            return None
-            
-        elif policy.node_type == 'AND':
-            parts = []
-            for child in policy.children:
-                part = self._reconstruct_secret(child, shares, sk)
-                if part is None:
-                    return None
-                parts.append(part)
-            return sum(parts) % self.q
-            
-        elif policy.node_type == 'OR':
-            for child in policy.children:
-                secret = self._reconstruct_secret(child, shares, sk)
-                if secret is not None:
-                    return secret
-            return None
-            
-        elif policy.node_type == 'THRESHOLD':
-            points = []
-            for child in policy.children:
-                if len(points) >= policy.threshold[0]:
-                    break
-                if (y := self._reconstruct_secret(child, shares, sk)) is not None:
-                    points.append((self._hash_attr(child.attribute), y))
-            
-            if len(points) < policy.threshold[0]:
+    def _apply_plan(self, plan: Plan, shares: Dict[str, int]) -> Optional[int]:
+        """Combinaison linéaire des parts indiquée par le plan"""
+        s = 0
+        for attr, coef in plan:
+            share = shares.get(attr)
+            if share is None:
                 return None
-                
-            # Interpolation de Lagrange
-            secret = 0
-            for i, (xi, yi) in enumerate(points):
-                term = yi
-                for j, (xj, _) in enumerate(points):
-                    if i != j:
-                        term = term * (0 - xj) * pow(xi - xj, -1, self.q) % self.q
-                secret = (secret + term) % self.q
-            return secret
-
-    def _check_policy(self, policy: PolicyNode, attrs: Dict[str, int]) -> bool:
-        """Vérifie si les attributs satisfont la politique"""
-        if policy.node_type == 'ATTR':
-            return policy.attribute in attrs
-            
-        elif policy.node_type == 'AND':
-            return all(self._check_policy(c, attrs) for c in policy.children)
-            
-        elif policy.node_type == 'OR':
-            return any(self._check_policy(c, attrs) for c in policy.children)
-            
-        elif policy.node_type == 'THRESHOLD':
-            k, _ = policy.threshold
-            satisfied = sum(1 for c in policy.children if self._check_policy(c, attrs))
-            return satisfied >= k
+            s += share if coef == 1 else coef * share
+        return s % self.q
 
     def _hash_attr(self, attr: str) -> int:
         """Hash un attribut en un entier modulo q"""
-        return int.from_bytes(
-            hashlib.sha3_256(attr.encode()).digest(),
-            'big'
-        ) % self.q
+        return _attr_digest(attr) % self.q
+
+@lru_cache(maxsize=4096)
+def _attr_digest(attr: str) -> int:
+    """Empreinte SHA3 d'un attribut, calculée une fois par attribut"""
+    return int.from_bytes(hashlib.sha3_256(attr.encode()).digest(), 'big')
+
+# === FORMAT BINAIRE ===
+# Chiffré (magic b"AB") :
+#   en-tête (magic, version, largeur w des éléments en octets)
+#   identifiant de politique (1 octet de longueur + ASCII)
+#   C_tilde, C (w octets chacun)
+#   table des attributs (2 octets de nombre, puis 1 octet de longueur + UTF-8 par attribut :
+#   un nom d'attribut fait au plus MAX_ATTRIBUTE_LENGTH octets)
+#   parts, dans l'ordre de la table (w octets chacune)
+#   iv, tag (1 octet de longueur + octets chacun), puis le chiffré AES jusqu'à la fin
+# Clé utilisateur (magic b"AK") :
+#   en-tête, K, L (w octets chacun), table des attributs, composantes D dans l'ordre de la table
+# Flux chiffré (magic b"AS") :
+#   en-tête, longueur de l'encapsulation (4 octets), encapsulation (identifiant de
+#   politique, C_tilde, C, table des attributs, parts), puis segments STREAM (voir stream.py)
+CIPHERTEXT_MAGIC = b"AB"
+USER_KEY_MAGIC = b"AK"
+STREAM_MAGIC = b"AS"
+STREAM_LENGTH = struct.Struct(">I")
+FORMAT_VERSION = 1
+FORMAT_HEADER = struct.Struct(">2sBH")
+COUNT = struct.Struct(">H")
+MAX_ATTRIBUTE_LENGTH = 255
+
+def element_width(p: int) -> int:
+    """Largeur en octets d'un élément du groupe (et d'un exposant, q < p)"""
+    return (p.bit_length() + 7) // 8
+
+def check_attribute(name: str) -> str:
+    """Vérifie qu'un attribut (déjà en majuscules) tient dans la table des attributs du format binaire"""
+    if len(name.encode('utf-8')) > MAX_ATTRIBUTE_LENGTH:
+        raise ValueError(f"Attribut trop long (plus de {MAX_ATTRIBUTE_LENGTH} octets en UTF-8): {name[:32]}...")
+    return name
+
+def _pack_attributes(names: List[str]) -> bytes:
+    out = [COUNT.pack(len(names))]
+    for name in names:
+        raw = check_attribute(name).encode('utf-8')
+        out.append(bytes([len(raw)]) + raw)
+    return b"".join(out)
+
+def _read_header(data: bytes, magic: bytes) -> int:
+    found, version, width = FORMAT_HEADER.unpack_from(data)
+    if found != magic:
+        raise ValueError("Format binaire inconnu")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Version de format non supportée: {version}")
+    return width
+
+def _read_attributes(data: bytes, pos: int) -> Tuple[List[str], int]:
+    (count,) = COUNT.unpack_from(data, pos)
+    pos += COUNT.size
+    names = []
+    for _ in range(count):
+        end = pos + 1 + data[pos]
+        names.append(data[pos + 1:end].decode('utf-8'))
+        pos = end
+    return names, pos
+
+def _check_length(data: bytes, pos: int):
+    # Les tranches ne lèvent pas d'erreur : la longueur est vérifiée après lecture
+    if pos > len(data):
+        raise ValueError("Données binaires tronquées")
+
+def _pack_encapsulation(ciphertext: Dict, w: int) -> bytes:
+    policy_id = ciphertext['policy_id'].encode('ascii')
+    names = list(ciphertext['shares'])
+    return b"".join([
+        bytes([len(policy_id)]), policy_id,
+        int(ciphertext['C_tilde']).to_bytes(w, 'big'),
+        int(ciphertext['C']).to_bytes(w, 'big'),
+        _pack_attributes(names),
+        b"".join(int(ciphertext['shares'][name]).to_bytes(w, 'big') for name in names),
+    ])
+
+def _unpack_encapsulation(data: bytes, pos: int, w: int) -> Tuple[Dict, int]:
+    end = pos + 1 + data[pos]
+    policy_id = data[pos + 1:end].decode('ascii')
+    C_tilde = int.from_bytes(data[end:end + w], 'big')
+    C = int.from_bytes(data[end + w:end + 2 * w], 'big')
+    names, pos = _read_attributes(data, end + 2 * w)
+    shares = {}
+    for name in names:
+        shares[name] = int.from_bytes(data[pos:pos + w], 'big')
+        pos += w
+    return {'policy_id': policy_id, 'C_tilde': C_tilde, 'C': C, 'shares': shares}, pos
+
+def pack_ciphertext(ciphertext: Dict, p: int) -> bytes:
+    """Encode un chiffré portant un policy_id (les chiffrés avec arbre restent en pickle)"""
+    w = element_width(p)
+    return b"".join([
+        FORMAT_HEADER.pack(CIPHERTEXT_MAGIC, FORMAT_VERSION, w),
+        _pack_encapsulation(ciphertext, w),
+        bytes([len(ciphertext['iv'])]), ciphertext['iv'],
+        bytes([len(ciphertext['tag'])]), ciphertext['tag'],
+        ciphertext['ciphertext'],
+    ])
+
+def unpack_ciphertext(data: bytes) -> Dict:
+    """Décode un chiffré produit par pack_ciphertext"""
+    try:
+        w = _read_header(data, CIPHERTEXT_MAGIC)
+        ciphertext, pos = _unpack_encapsulation(data, FORMAT_HEADER.size, w)
+        end = pos + 1 + data[pos]
+        ciphertext['iv'] = data[pos + 1:end]
+        pos = end + 1 + data[end]
+        ciphertext['tag'] = data[end + 1:pos]
+    except (IndexError, struct.error) as e:
+        raise ValueError("Données binaires tronquées") from e
+    _check_length(data, pos)
+    ciphertext['ciphertext'] = data[pos:]
+    return ciphertext
+
+def pack_stream_header(header: Dict, p: int) -> bytes:
+    """Encode l'en-tête d'un flux chiffré : encapsulation ABE précédée de sa longueur"""
+    w = element_width(p)
+    body = _pack_encapsulation(header, w)
+    return FORMAT_HEADER.pack(STREAM_MAGIC, FORMAT_VERSION, w) + STREAM_LENGTH.pack(len(body)) + body
+
+def read_stream_header(stream) -> Dict:
+    """Lit l'en-tête d'un flux chiffré ; le flux est ensuite positionné sur les segments"""
+    prefix = aead_stream.read_exact(stream, FORMAT_HEADER.size + STREAM_LENGTH.size)
+    if len(prefix) != FORMAT_HEADER.size + STREAM_LENGTH.size:
+        raise ValueError("Données binaires tronquées")
+    w = _read_header(prefix, STREAM_MAGIC)
+    (length,) = STREAM_LENGTH.unpack_from(prefix, FORMAT_HEADER.size)
+    body = aead_stream.read_exact(stream, length)
+    if len(body) != length:
+        raise ValueError("Données binaires tronquées")
+    try:
+        header, pos = _unpack_encapsulation(body, 0, w)
+    except (IndexError, struct.error) as e:
+        raise ValueError("Données binaires tronquées") from e
+    _check_length(body, pos)
+    return header
+
+def pack_user_key(sk: UserKey, p: int) -> bytes:
+    """Encode une clé utilisateur"""
+    w = element_width(p)
+    names = list(sk.attrs)
+    return b"".join([
+        FORMAT_HEADER.pack(USER_KEY_MAGIC, FORMAT_VERSION, w),
+        int(sk.K).to_bytes(w, 'big'),
+        int(sk.L).to_bytes(w, 'big'),
+        _pack_attributes(names),
+        b"".join(int(sk.attrs[name]).to_bytes(w, 'big') for name in names),
+    ])
+
+def unpack_user_key(data: bytes) -> UserKey:
+    """Décode une clé produite par pack_user_key"""
+    try:
+        w = _read_header(data, USER_KEY_MAGIC)
+        pos = FORMAT_HEADER.size
+        K = int.from_bytes(data[pos:pos + w], 'big')
+        L = int.from_bytes(data[pos + w:pos + 2 * w], 'big')
+        names, pos = _read_attributes(data, pos + 2 * w)
+    except (IndexError, struct.error) as e:
+        raise ValueError("Données binaires tronquées") from e
+    attrs = {}
+    for name in names:
+        attrs[name] = int.from_bytes(data[pos:pos + w], 'big')
+        pos += w
+    _check_length(data, pos)
+    return UserKey(K=K, L=L, attrs=attrs)
 
 # === EXEMPLE D'UTILISATION ===
 if __name__ == "__main__":
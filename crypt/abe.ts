@@ -13,8 +13,30 @@ export interface EncryptResponse {
     message: string;
 }
 
+export interface EncryptRowResponse {
+    encrypted_data: Record<string, string>;
+    policy: Record<string, string[][]>;
+    message: string;
+}
+
 export interface DecryptResponse {
     decrypted_data: string;
+    user_key_handle: string;
+    message: string;
+}
+
+export interface DecryptBatchResponse {
+    results: ({ decrypted_data: string } | { error: string })[];
+    user_key_handle: string;
+    message: string;
+}
+
+export type GenerateKeyBatchLine =
+    | { index: number; user_key: string }
+    | { index: number; error: string };
+
+export interface RegisterKeyResponse {
+    user_key_handle: string;
     message: string;
 }
 
@@ -30,7 +52,52 @@ const handleFetch = async (url: string, options: RequestInit = {}) => {
     });
 
     const data = await res.json();
-    if (!res.ok) throw new Error(data.error || 'Request failed');
+    if (!res.ok) throw new ABEError(data.error || 'Request failed', res.status);
+    return data;
+};
+
+const postStream = async (url: string, body: BodyInit, headers: Record<string, string>): Promise<Response> => {
+    const res = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/octet-stream', ...headers },
+        body,
+        duplex: 'half',
+    } as RequestInit);
+    if (!res.ok) {
+        const data = await res.json();
+        throw new ABEError(data.error || 'Request failed', res.status);
+    }
+    return res;
+};
+
+export class ABEError extends Error {
+    constructor(message: string, public status: number) {
+        super(message);
+    }
+}
+
+// Poignées des clés utilisateur déjà connues du serveur : la clé complète
+// n'est renvoyée que si le serveur a oublié la poignée (404)
+const userKeyHandles = new Map<string, string>();
+
+const postWithUserKey = async (url: string, user_key: string, body: object) => {
+    const user_key_handle = userKeyHandles.get(user_key);
+    if (user_key_handle) {
+        try {
+            return await handleFetch(url, {
+                method: 'POST',
+                body: JSON.stringify({ ...body, user_key_handle }),
+            });
+        } catch (e) {
+            if (!(e instanceof ABEError && e.status == 404)) throw e;
+            userKeyHandles.delete(user_key);
+        }
+    }
+    const data = await handleFetch(url, {
+        method: 'POST',
+        body: JSON.stringify({ ...body, user_key }),
+    });
+    userKeyHandles.set(user_key, data.user_key_handle);
     return data;
 };
 
@@ -58,14 +125,66 @@ export class ABE {
         });
     }
 
+    static async encryptRow(
+        table: string,
+        fields: Record<string, string>,
+        service?: string
+    ): Promise<EncryptRowResponse> {
+        return await handleFetch(`${API_BASE}/encrypt_row`, {
+            method: 'POST',
+            body: JSON.stringify({ table, fields, service }),
+        });
+    }
+
     static async decrypt(
         encrypted_data: string,
         user_key: string
     ): Promise<DecryptResponse> {
-        return await handleFetch(`${API_BASE}/decrypt`, {
+        return await postWithUserKey(`${API_BASE}/decrypt`, user_key, { encrypted_data });
+    }
+
+    static async decryptBatch(
+        encrypted_data: string[],
+        user_key: string
+    ): Promise<DecryptBatchResponse> {
+        return await postWithUserKey(`${API_BASE}/decrypt_batch`, user_key, { encrypted_data });
+    }
+
+    // Chiffrement en flux d'une colonne volumineuse : la réponse est lue au fur et à mesure
+    static async encryptStream(
+        table: string,
+        column: string,
+        body: BodyInit,
+        service?: string
+    ): Promise<Response> {
+        return await postStream(`${API_BASE}/encrypt_stream`, body, {
+            'X-ABE-Table': table,
+            'X-ABE-Column': column,
+            ...(service ? { 'X-ABE-Service': service } : {}),
+        });
+    }
+
+    static async decryptStream(body: BodyInit, user_key: string): Promise<Response> {
+        const user_key_handle = userKeyHandles.get(user_key);
+        if (user_key_handle && !(body instanceof ReadableStream)) {
+            // Le corps d'un ReadableStream ne peut être envoyé qu'une fois : pas de nouvel essai possible
+            try {
+                return await postStream(`${API_BASE}/decrypt_stream`, body, { 'X-ABE-User-Key-Handle': user_key_handle });
+            } catch (e) {
+                if (!(e instanceof ABEError && e.status == 404)) throw e;
+                userKeyHandles.delete(user_key);
+            }
+        }
+        return await postStream(`${API_BASE}/decrypt_stream`, body, { 'X-ABE-User-Key': user_key });
+    }
+
+    static async registerUserKey(user_key: string): Promise<RegisterKeyResponse> {
+        const data = await handleFetch(`${API_BASE}/register_user_key`, {
             method: 'POST',
-            body: JSON.stringify({ encrypted_data, user_key }),
+            body: JSON.stringify({ user_key }),
         });
+        userKeyHandles.set(user_key, data.user_key_handle);
+        return data;
     }
 
     static async generateUserKey(attributes: string[] | string[][]): Promise<GenerateKeyResponse> {
@@ -74,4 +193,32 @@ export class ABE {
             body: JSON.stringify({ attributes }),
         });
     }
+
+    // Génère plusieurs clés en un appel ; chaque clé est rendue dès qu'elle est prête
+    // (l'ordre de fin n'est pas l'ordre de la requête : se fier à index)
+    static async *generateUserKeysBatch(attributes: (string[] | string[][])[]): AsyncGenerator<GenerateKeyBatchLine> {
+        const res = await fetch(`${API_BASE}/generate_user_keys_batch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ attributes }),
+        });
+        if (!res.ok) {
+            const data = await res.json();
+            throw new ABEError(data.error || 'Request failed', res.status);
+        }
+
+        const reader = res.body!.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += value;
+            const lines = buffer.split('\n');
+            buffer = lines.pop()!;
+            for (const line of lines) {
+                if (line) yield JSON.parse(line);
+            }
+        }
+        if (buffer) yield JSON.parse(buffer);
+    }
 };
@@ -1,14 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import pickle
 import base64
-from abe import CPABE, PolicyNode, MasterKey, UserKey
-from typing import Dict, List
+from abe import (CPABE, MasterKey, UserKey, SessionPool, CIPHERTEXT_MAGIC, USER_KEY_MAGIC,
+                 pack_ciphertext, unpack_ciphertext, pack_user_key, unpack_user_key, read_stream_header)
+from cache import LRUCache
+from policy import PolicyCompiler, PolicyRegistry
+from primes import fork_context
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 import os
 import json
+import logging
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from hashlib import sha256
+from itertools import repeat
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 envKey = json.loads(base64.b64decode(os.getenv("ABE_MASTER_KEY")))
@@ -16,12 +27,128 @@ envKey = json.loads(base64.b64decode(os.getenv("ABE_MASTER_KEY")))
 cpabe_data = pickle.loads(base64.b64decode(envKey['cpabe']))
 mpk = pickle.loads(base64.b64decode(envKey['mpk']))
 msk = pickle.loads(base64.b64decode(envKey['msk']))
+mpk.precompute()  # Tables à base fixe construites une seule fois au chargement
+
+# Réinitialisation de CPABE avec les paramètres stockés (sans génération de nombres premiers)
+cpabe = CPABE.from_params(cpabe_data['p'], cpabe_data['q'], cpabe_data['g'])
+
+# Génération de nouveaux paramètres (/api/init)
+# ABE_SECURITY_PARAM : taille en bits de q (p = 2q + 1)
+# ABE_SETUP_WORKERS : processus pour la recherche du premier sûr (vide = nombre de cœurs)
+ABE_SECURITY_PARAM = int(os.getenv("ABE_SECURITY_PARAM", "256"))
+ABE_SETUP_WORKERS = int(os.getenv("ABE_SETUP_WORKERS") or os.cpu_count())
+
+# Pool de sessions de chiffrement précalculées (phase hors ligne de /api/encrypt)
+# ABE_POOL_SIZE : nombre de sessions gardées (0 = désactivé)
+# ABE_POOL_LOW_WATER : seuil sous lequel le pool est rempli à nouveau
+ABE_POOL_SIZE = int(os.getenv("ABE_POOL_SIZE", "256"))
+ABE_POOL_LOW_WATER = int(os.getenv("ABE_POOL_LOW_WATER", str(ABE_POOL_SIZE // 2)))
+
+# Pools de processus pour /api/decrypt_batch et /api/generate_user_keys_batch
+# ABE_WORKERS : nombre de processus pour les déchiffrements en lot (0 = désactivé)
+# ABE_KEYGEN_WORKERS : nombre de processus pour la génération de clés en lot
+#                      (0 = pool ABE_WORKERS s'il existe, sinon fil de la requête ; valeur par défaut)
+# ABE_PARALLEL_THRESHOLD : nombre d'éléments à partir duquel le lot est réparti entre les processus
+# ABE_KEYGEN_CHUNK : nombre de clés générées par tâche envoyée à un processus
+ABE_WORKERS = int(os.getenv("ABE_WORKERS", "0"))
+ABE_KEYGEN_WORKERS = int(os.getenv("ABE_KEYGEN_WORKERS", "0"))
+ABE_PARALLEL_THRESHOLD = int(os.getenv("ABE_PARALLEL_THRESHOLD", "64"))
+ABE_KEYGEN_CHUNK = int(os.getenv("ABE_KEYGEN_CHUNK", "16"))
+executor = None
+keygen_executor = None
+
+# Les processus des pools sont toujours créés par fork : ils héritent de l'état du module
+# (clés, tables à base fixe partagées en copie à l'écriture ; ce partage n'existe qu'avec fork). Avec spawn ou forkserver
+# (défauts de macOS et de Python 3.14), chaque processus réimporterait ce module,
+# qui démarre ses propres pools à l'import. Sans fork (Windows), les pools sont désactivés.
+FORK = fork_context()
+
+# Cache des clés utilisateur désérialisées, indexées par une poignée (empreinte du contenu)
+# ABE_KEY_CACHE_SIZE : nombre de clés gardées (0 = désactivé)
+# ABE_KEY_CACHE_TTL : durée de vie d'une entrée en secondes (0 = illimitée)
+ABE_KEY_CACHE_SIZE = int(os.getenv("ABE_KEY_CACHE_SIZE", "1024"))
+ABE_KEY_CACHE_TTL = int(os.getenv("ABE_KEY_CACHE_TTL", "3600"))
+user_keys = LRUCache(ABE_KEY_CACHE_SIZE, ABE_KEY_CACHE_TTL)
 
-# Réinitialisation de CPABE avec les paramètres stockés
-cpabe = CPABE(256)
-cpabe.p = cpabe_data['p']
-cpabe.q = cpabe_data['q']
-cpabe.g = cpabe_data['g']
+# Cache (opt-in) des clés AES dérivées, pour les chiffrés relus avec la même clé utilisateur
+# ABE_DERIVED_KEY_CACHE_SIZE : nombre de clés gardées (0 = désactivé, valeur par défaut)
+# ABE_DERIVED_KEY_CACHE_TTL : durée de vie d'une entrée en secondes
+ABE_DERIVED_KEY_CACHE_SIZE = int(os.getenv("ABE_DERIVED_KEY_CACHE_SIZE", "0"))
+ABE_DERIVED_KEY_CACHE_TTL = int(os.getenv("ABE_DERIVED_KEY_CACHE_TTL", "300"))
+
+# Politiques compilées une seule fois par (table, colonne, service)
+# ABE_SERVICES : services connus, séparés par des virgules (par défaut les départements et rôles
+# de l'application). Une politique qui dépend d'un service absent de la liste n'est ni mémorisée
+# ni enregistrée : le chiffré porte son arbre
+ABE_SERVICES = [s.strip() for s in os.getenv("ABE_SERVICES", ",".join((
+    "cardiology", "neurology", "pediatrics", "orthopedics", "emergency", "surgery",
+    "admin", "reception", "medecin", "infirmier", "radiologue", "laborantin", "comptable", "patient",
+))).split(",") if s.strip()]
+policies = PolicyCompiler(services=ABE_SERVICES)
+
+# Registre persistant des politiques : les chiffrés ne portent que leur identifiant
+# ABE_POLICY_REGISTRY : chemin du fichier JSON du registre (obligatoire). Il doit être conservé
+# et sauvegardé avec la base : sans lui, les chiffrés qui n'en portent que l'identifiant sont illisibles
+ABE_POLICY_REGISTRY = os.getenv("ABE_POLICY_REGISTRY")
+if not ABE_POLICY_REGISTRY:
+    raise RuntimeError("ABE_POLICY_REGISTRY doit indiquer le fichier du registre des politiques")
+registry = PolicyRegistry(ABE_POLICY_REGISTRY, policies)
+
+class UnknownKeyHandle(KeyError):
+    """Poignée absente du cache (jamais enregistrée, évincée ou expirée)"""
+
+def _init_worker(cpabe_params, worker_mpk, worker_msk):
+    """Initialise un processus du pool : paramètres et clés maîtresses fixés une seule fois"""
+    global cpabe, mpk, msk
+    cpabe = CPABE.from_params(*cpabe_params)
+    if ABE_DERIVED_KEY_CACHE_SIZE > 0:
+        cpabe.enable_key_cache(ABE_DERIVED_KEY_CACHE_SIZE, ABE_DERIVED_KEY_CACHE_TTL)
+    mpk = worker_mpk
+    msk = worker_msk
+    # Processus créés par fork : les tables à base fixe du parent sont partagées
+    # (copie à l'écriture) ; elles ne sont reconstruites que si elles manquent
+    mpk.tables
+
+# Le pool de sessions et les processus dépendent de la clé maîtresse :
+# ils sont arrêtés puis recréés quand elle change. stop_workers attend la fin des fils
+# (remplissage du pool, purge du cache) : les fork qui suivent (recherche des premiers
+# de /api/init, processus des pools) se font depuis un processus sans autre fil de fond
+def start_workers():
+    global executor, keygen_executor
+    if FORK is None:
+        if ABE_WORKERS > 0 or ABE_KEYGEN_WORKERS > 0:
+            logger.warning("ABE_WORKERS et ABE_KEYGEN_WORKERS ignorés : les processus des pools nécessitent fork")
+    else:
+        executor = _process_pool(ABE_WORKERS)
+        keygen_executor = _process_pool(ABE_KEYGEN_WORKERS)
+    if ABE_POOL_SIZE > 0:
+        cpabe.pool = SessionPool(cpabe, mpk, ABE_POOL_SIZE, ABE_POOL_LOW_WATER)
+    if ABE_DERIVED_KEY_CACHE_SIZE > 0:
+        cpabe.enable_key_cache(ABE_DERIVED_KEY_CACHE_SIZE, ABE_DERIVED_KEY_CACHE_TTL)
+
+def stop_workers():
+    global executor, keygen_executor
+    cpabe.disable_key_cache()
+    if cpabe.pool is not None:
+        cpabe.pool.stop()
+        cpabe.pool = None
+    for pool in (executor, keygen_executor):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    executor = keygen_executor = None
+
+def _process_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    """Pool de processus initialisés avec la clé maîtresse courante (None si workers vaut 0)"""
+    if workers <= 0:
+        return None
+    pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=FORK, initializer=_init_worker,
+        initargs=((cpabe.p, cpabe.q, cpabe.g), mpk, msk))
+    # Démarrage immédiat des processus, avant le thread du pool de sessions.
+    # os.getpid ne dépend pas de ce module, qui peut être encore en cours d'import
+    for future in [pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return pool
 
 # 1. API pour la génération initiale des clés et paramètres
 @app.route('/api/init', methods=['GET'])
@@ -29,8 +156,12 @@ def initialize_system():
     global cpabe, mpk, msk
     
     # Génération des paramètres et clés
-    cpabe = CPABE(256)
+    stop_workers()
+    cpabe = CPABE(ABE_SECURITY_PARAM, workers=ABE_SETUP_WORKERS)
     mpk, msk = cpabe.setup()
+    mpk.precompute()
+    user_keys.clear()
+    start_workers()
     
     # Sérialisation des données
     cpabe_data = {
@@ -61,12 +192,13 @@ def load_keys():
         cpabe_data = pickle.loads(base64.b64decode(data['cpabe']))
         mpk = pickle.loads(base64.b64decode(data['mpk']))
         msk = pickle.loads(base64.b64decode(data['msk']))
+        mpk.precompute()
         
         # Réinitialisation de CPABE avec les paramètres stockés
-        cpabe = CPABE(256)
-        cpabe.p = cpabe_data['p']
-        cpabe.q = cpabe_data['q']
-        cpabe.g = cpabe_data['g']
+        stop_workers()
+        cpabe = CPABE.from_params(cpabe_data['p'], cpabe_data['q'], cpabe_data['g'])
+        user_keys.clear()
+        start_workers()
         
         return jsonify({'message': 'Clés chargées avec succès'})
     except Exception as e:
@@ -90,7 +222,7 @@ def encrypt_data():
         encrypted_data, policy_list = encrypt_field(table, column, plaintext, service)
         
         # Sérialisation des données chiffrées
-        encrypted_data_serialized = base64.b64encode(pickle.dumps(encrypted_data)).decode('utf-8')
+        encrypted_data_serialized = dump_ciphertext(encrypted_data)
         
         return jsonify({
             'encrypted_data': encrypted_data_serialized,
@@ -100,6 +232,33 @@ def encrypt_data():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+# 3 bis. API pour le chiffrement de plusieurs colonnes d'une même ligne
+@app.route('/api/encrypt_row', methods=['POST'])
+def encrypt_row_data():
+    global cpabe, mpk
+    
+    if not cpabe or not mpk:
+        return jsonify({'error': 'Système non initialisé'}), 400
+    
+    data = request.json
+    table = data.get('table')
+    fields = data.get('fields')
+    service = data.get('service', None)
+    
+    try:
+        encrypted_fields, policies = encrypt_row(table, fields, service)
+        
+        return jsonify({
+            'encrypted_data': {
+                column: dump_ciphertext(encrypted)
+                for column, encrypted in encrypted_fields.items()
+            },
+            'policy': policies,
+            'message': 'Données chiffrées avec succès'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
 # 4. API pour le déchiffrement
 @app.route('/api/decrypt', methods=['POST'])
 def decrypt_data():
@@ -110,20 +269,124 @@ def decrypt_data():
     
     data = request.json
     encrypted_data_b64 = data.get('encrypted_data')
-    user_key_b64 = data.get('user_key')
     
     try:
         # Désérialisation des données
-        encrypted_data = pickle.loads(base64.b64decode(encrypted_data_b64))
-        user_key = pickle.loads(base64.b64decode(user_key_b64))
+        encrypted_data = load_ciphertext(encrypted_data_b64)
+        handle, user_key = resolve_user_key(data)
         
         # Déchiffrement
-        decrypted = decrypt_field(user_key, encrypted_data)
+        decrypted = decrypt_field(user_key, encrypted_data, handle)
         
         return jsonify({
             'decrypted_data': decrypted,
+            'user_key_handle': handle,
             'message': 'Données déchiffrées avec succès'
         })
+    except UnknownKeyHandle as e:
+        return jsonify({'error': f'Poignée de clé inconnue ou expirée: {e.args[0]}'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+# 4 bis. API pour le déchiffrement d'un lot de chiffrés avec la même clé
+@app.route('/api/decrypt_batch', methods=['POST'])
+def decrypt_batch():
+    global cpabe, mpk
+    
+    if not cpabe or not mpk:
+        return jsonify({'error': 'Système non initialisé'}), 400
+    
+    data = request.json
+    items = data.get('encrypted_data') or []
+    
+    try:
+        handle, user_key = resolve_user_key(data)
+        if executor is not None and len(items) >= ABE_PARALLEL_THRESHOLD:
+            # Répartition du lot en un bloc par processus
+            size = -(-len(items) // ABE_WORKERS)
+            chunks = [items[i:i + size] for i in range(0, len(items), size)]
+            results = []
+            for part in executor.map(decrypt_items, repeat(user_key), chunks, repeat(handle)):
+                results.extend(part)
+        else:
+            results = decrypt_items(user_key, items, handle)
+        
+        return jsonify({
+            'results': results,
+            'user_key_handle': handle,
+            'message': 'Lot traité'
+        })
+    except UnknownKeyHandle as e:
+        return jsonify({'error': f'Poignée de clé inconnue ou expirée: {e.args[0]}'}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+# 4 ter. API pour l'enregistrement d'une clé utilisateur : les appels suivants
+# peuvent passer la poignée retournée (user_key_handle) au lieu de la clé complète
+@app.route('/api/register_user_key', methods=['POST'])
+def register_user_key():
+    data = request.json
+    
+    try:
+        handle, _ = cache_user_key(data.get('user_key'))
+        return jsonify({
+            'user_key_handle': handle,
+            'message': 'Clé enregistrée'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+# 4 quater. API pour le chiffrement et le déchiffrement en flux (résultats de radiologie, détails
+# d'analyse...) : le corps de la requête est lu et la réponse envoyée par segments de TAILLE_BLOC.
+# La colonne est passée dans les en-têtes X-ABE-Table, X-ABE-Column et X-ABE-Service ; la clé dans
+# X-ABE-User-Key-Handle ou X-ABE-User-Key
+TAILLE_BLOC = 64 * 1024
+
+@app.route('/api/encrypt_stream', methods=['POST'])
+def encrypt_stream():
+    global cpabe, mpk
+    
+    if not cpabe or not mpk:
+        return jsonify({'error': 'Système non initialisé'}), 400
+    
+    table = request.headers.get('X-ABE-Table')
+    column = request.headers.get('X-ABE-Column')
+    if not table or not column:
+        return jsonify({'error': 'En-têtes X-ABE-Table et X-ABE-Column requis'}), 400
+    
+    service = request.headers.get('X-ABE-Service')
+    if not policies.is_known(table, column, service):
+        return jsonify({'error': f'Aucune règle de politique pour {table}.{column} (service {service})'}), 400
+    
+    try:
+        policy = policies.for_field(table, column, service)
+        blocs = iter(lambda: request.stream.read(TAILLE_BLOC), b'')
+        flux = cpabe.encrypt_stream(mpk, blocs, policy.root, registry.register(policy), TAILLE_BLOC)
+        # L'en-tête est calculé ici pour pouvoir renvoyer une erreur JSON
+        premier = next(flux)
+        return Response(stream_with_context(chain([premier], flux)), mimetype='application/octet-stream')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/decrypt_stream', methods=['POST'])
+def decrypt_stream():
+    global cpabe, mpk
+    
+    if not cpabe or not mpk:
+        return jsonify({'error': 'Système non initialisé'}), 400
+    
+    try:
+        _, user_key = resolve_user_key({
+            'user_key_handle': request.headers.get('X-ABE-User-Key-Handle'),
+            'user_key': request.headers.get('X-ABE-User-Key'),
+        })
+        # En-tête lu et vérifié une seule fois, avant d'envoyer la réponse
+        header = resolve_policy(read_stream_header(request.stream))
+        flux = cpabe.decrypt_stream(mpk, user_key, header, request.stream, TAILLE_BLOC)
+        premier = next(flux, b'')
+        return Response(stream_with_context(chain([premier], flux)), mimetype='application/octet-stream')
+    except UnknownKeyHandle as e:
+        return jsonify({'error': f'Poignée de clé inconnue ou expirée: {e.args[0]}'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
@@ -143,7 +406,7 @@ def generate_user_key():
         user_key = cpabe.keygen2(mpk, msk, attributes)
         
         # Sérialisation de la clé
-        user_key_serialized = base64.b64encode(pickle.dumps(user_key)).decode('utf-8')
+        user_key_serialized = dump_user_key(user_key)
         
         return jsonify({
             'user_key': user_key_serialized,
@@ -152,72 +415,184 @@ def generate_user_key():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+# 5 bis. API pour la génération de clés utilisateur en lot
+# Réponse NDJSON : une ligne {"index", "user_key"} ou {"index", "error"} par clé, dans l'ordre de fin
+@app.route('/api/generate_user_keys_batch', methods=['POST'])
+def generate_user_keys_batch():
+    global cpabe, mpk, msk
+    
+    if not cpabe or not mpk or not msk:
+        return jsonify({'error': 'Système non initialisé'}), 400
+    
+    attribute_sets = request.json.get('attributes') or []
+    chunks = [
+        (start, attribute_sets[start:start + ABE_KEYGEN_CHUNK])
+        for start in range(0, len(attribute_sets), ABE_KEYGEN_CHUNK)
+    ]
+    
+    pool = keygen_executor or executor
+    
+    def generate():
+        if pool is not None and len(attribute_sets) >= ABE_PARALLEL_THRESHOLD:
+            futures = [pool.submit(keygen_chunk, start, chunk) for start, chunk in chunks]
+            finished = (future.result() for future in as_completed(futures))
+        else:
+            finished = (keygen_chunk(start, chunk) for start, chunk in chunks)
+        for results in finished:
+            for result in results:
+                yield json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# 6. API pour les métriques de performance
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    pool = cpabe.pool
+    return jsonify({
+        'session_pool': pool.stats() if pool is not None else None,
+        'user_key_cache': user_keys.stats(),
+        'derived_key_cache': cpabe.key_cache.stats() if cpabe.key_cache is not None else None
+    })
+
 # Fonctions utilitaires (reprises du code original)
 def encrypt_field(table: str, column: str, plaintext: str, service: str = None):
     """Chiffre un champ selon sa politique associée"""
-    # Détermination de la politique
-    policy_list = []
-    
-    # Cas dynamiques
-    if (table, column) in [('PATIENT', 'dossier_medical')]:
-        policy_list = [['MEDECIN', service.upper()]]
-    elif (table, column) in [
-        ('prelevement', 'temperature'),
-        ('prelevement', 'observation'),
-        ('prelevement', 'tension_art'),
-        ('prelevement', 'pulsation'),
-        ('prelevement', 'tension_resp')
-    ]:
-        policy_list = [['MEDECIN', service.upper()], ['INFIRMIER', service.upper()]]
-    elif (table, column) in [
-        ('analyse_medicale', 'examen'),
-        ('analyse_medicale', 'valeur_details')
-    ]:
-        policy_list = [['MEDECIN', service.upper()], ['LABORANTIN']]
-    elif (table, column) in [
-        ('radio', 'type_radio'),
-        ('radio', 'resultat')
-    ]:
-        policy_list = [['MEDECIN', service.upper()], ['RADIOLOGUE']]
-    else:
-        # Cas statiques (simplifié pour l'exemple)
-        policy_list = [table.upper()]
+    policy = policies.for_field(table, column, service)
     
-    # Conversion en PolicyNode
-    policy = list_to_policy(policy_list)
+    # Chiffrement (l'arbre PolicyNode est déjà construit, seul son identifiant est stocké)
+    encrypted_data = cpabe.encrypt(mpk, plaintext.encode('utf-8'), policy.root, register_policy(table, column, service, policy))
     
-    # Chiffrement
-    encrypted_data = cpabe.encrypt(mpk, plaintext.encode('utf-8'), policy)
+    return encrypted_data, policy.policy_list
+
+def encrypt_row(table: str, fields: Dict[str, str], service: str = None):
+    """Chiffre les colonnes d'une ligne : une seule encapsulation par politique distincte"""
+    groups = {}
+    for column in fields:
+        policy = policies.for_field(table, column, service)
+        groups.setdefault((policy.policy_id, policies.is_known(table, column, service)), (policy, []))[1].append(column)
+    
+    encrypted_fields = {}
+    policy_lists = {}
+    for policy, columns in groups.values():
+        plaintexts = [fields[column].encode('utf-8') for column in columns]
+        encrypted_list = cpabe.encrypt_many(mpk, plaintexts, policy.root, register_policy(table, columns[0], service, policy))
+        for column, encrypted in zip(columns, encrypted_list):
+            encrypted_fields[column] = encrypted
+            policy_lists[column] = policy.policy_list
     
-    return encrypted_data, policy_list
+    return encrypted_fields, policy_lists
+
+def register_policy(table: str, column: str, service: Optional[str], policy) -> Optional[str]:
+    """Identifiant enregistré de la politique d'une règle connue.
+
+    Pour une table ou un service inconnus, rien n'est enregistré (None) : le chiffré porte
+    l'arbre de sa politique, ce qui évite qu'un appelant fasse grossir le registre sans limite.
+    """
+    if not policies.is_known(table, column, service):
+        return None
+    return registry.register(policy)
 
-def decrypt_field(user_key: UserKey, encrypted_data: Dict) -> str:
+def resolve_policy(encrypted_data: Dict) -> Dict:
+    """Rattache au chiffré l'arbre de sa politique quand il ne porte que son identifiant"""
+    if 'policy' not in encrypted_data:
+        encrypted_data['policy'] = registry.resolve(encrypted_data['policy_id']).root
+    return encrypted_data
+
+def decrypt_field(user_key: UserKey, encrypted_data: Dict, handle: str = None) -> str:
     """Déchiffre un champ avec la clé utilisateur"""     
+    resolve_policy(encrypted_data)
     try:
-        return cpabe.decrypt(mpk, user_key, encrypted_data).decode('utf-8')
+        return cpabe.decrypt(mpk, user_key, encrypted_data, handle).decode('utf-8')
     except ValueError as e:
         raise ValueError(str(e))
 
-def list_to_policy(policy_list: list) -> PolicyNode:
-    """Convertit une liste Python en arbre PolicyNode"""
-    def build_node(element):
-        if isinstance(element, list):
-            if any(isinstance(e, list) for e in element):
-                return PolicyNode("OR", [build_group(g) for g in element])
-            else:
-                return PolicyNode("AND", [build_attr(e) for e in element])
-        else:
-            return build_attr(element)
+def decrypt_items(user_key: UserKey, items: List[str], handle: str = None) -> List[Dict]:
+    """Déchiffre une liste de chiffrés (base64) : un résultat ou une erreur par élément, dans l'ordre"""
+    results = [None] * len(items)
+    ciphertexts, positions = [], []
+    for i, item in enumerate(items):
+        try:
+            ciphertexts.append(resolve_policy(load_ciphertext(item)))
+            positions.append(i)
+        except Exception as e:
+            results[i] = {'error': str(e)}
+    
+    for i, decrypted in zip(positions, cpabe.decrypt_many(mpk, user_key, ciphertexts, handle)):
+        try:
+            if isinstance(decrypted, Exception):
+                raise decrypted
+            results[i] = {'decrypted_data': decrypted.decode('utf-8')}
+        except Exception as e:
+            results[i] = {'error': str(e)}
+    return results
+
+# Sérialisation : format binaire versionné (abe.pack_*) ; les anciennes données
+# en pickle sont toujours acceptées en lecture
+def dump_ciphertext(encrypted_data: Dict) -> str:
+    """Chiffré -> base64 (pickle seulement pour un chiffré qui embarque son arbre de politique)"""
+    if 'policy_id' in encrypted_data:
+        raw = pack_ciphertext(encrypted_data, cpabe.p)
+    else:
+        raw = pickle.dumps(encrypted_data)
+    return base64.b64encode(raw).decode('utf-8')
+
+def load_ciphertext(encrypted_data_b64: str) -> Dict:
+    """base64 -> chiffré, format binaire ou ancien pickle"""
+    raw = base64.b64decode(encrypted_data_b64)
+    if raw[:2] == CIPHERTEXT_MAGIC:
+        return unpack_ciphertext(raw)
+    return pickle.loads(raw)
+
+def dump_user_key(user_key: UserKey) -> str:
+    return base64.b64encode(pack_user_key(user_key, cpabe.p)).decode('utf-8')
+
+def load_user_key(raw: bytes) -> UserKey:
+    """Octets -> clé utilisateur, format binaire ou ancien pickle"""
+    if raw[:2] == USER_KEY_MAGIC:
+        return unpack_user_key(raw)
+    user_key = pickle.loads(raw)
+    if not isinstance(user_key, UserKey):
+        raise ValueError("Clé utilisateur invalide")
+    return user_key
+
+def cache_user_key(user_key_b64: str):
+    """Désérialise une clé utilisateur et la garde en cache sous l'empreinte de son contenu"""
+    raw = base64.b64decode(user_key_b64)
+    handle = sha256(raw).hexdigest()[:32]
+    user_key = user_keys.get(handle)
+    if user_key is None:
+        user_key = load_user_key(raw)
+        user_keys.put(handle, user_key)
+    return handle, user_key
 
-    def build_group(group):
-        if isinstance(group, list):
-            return PolicyNode("AND", [build_attr(e) for e in group])
-        return build_attr(group)
+def resolve_user_key(data: Dict):
+    """Retrouve la clé d'une requête : poignée en cache d'abord, sinon clé complète (mise en cache au passage)"""
+    handle = data.get('user_key_handle')
+    if handle:
+        user_key = user_keys.get(handle)
+        if user_key is not None:
+            return handle, user_key
+    if not data.get('user_key'):
+        raise UnknownKeyHandle(handle)
+    return cache_user_key(data['user_key'])
 
-    def build_attr(attr):
-        return PolicyNode("ATTR", attribute=attr.upper())
+def keygen_chunk(start: int, attribute_sets: List[list]) -> List[Dict]:
+    """Génère les clés d'un bloc d'ensembles d'attributs (exécuté dans un processus du pool ou localement)"""
+    results = []
+    for index, attributes in enumerate(attribute_sets, start):
+        try:
+            user_key = cpabe.keygen2(mpk, msk, attributes)
+            results.append({
+                'index': index,
+                'user_key': dump_user_key(user_key)
+            })
+        except Exception as e:
+            results.append({'index': index, 'error': str(e)})
+    return results
 
-    return build_node(policy_list)
+# Démarré après toutes les définitions : les processus créés par fork
+# doivent trouver decrypt_items dans leur copie du module
+start_workers()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Modular arithmetic backend for the CP-ABE implementation.
+
+The group operations of abe.py (modular exponentiation, inversion, the
+products of the fixed-base tables, primality tests) go through this
+module so that they run on GMP when gmpy2 is installed, and on Python
+ints otherwise.
+
+The backend is chosen at import time: gmpy2 if it can be imported,
+unless the ABE_ARITH_BACKEND environment variable is set to "python" or
+"gmpy2". It can also be switched at runtime with use_backend(). Callers
+must go through the module (arith.powmod, not a from-import) so that a
+switch takes effect.
+
+Whatever the backend, powmod, invert and batch_inverse return Python
+ints: values produced here end up in ciphertexts, keys and hashes, and
+must not depend on the backend. mpz is exposed for hot loops that keep
+intermediate values in the backend's native type.
+"""
+
+import os
+
+from Cryptodome.Util.number import isPrime
+
+try:
+    import gmpy2
+except ImportError:  # gmpy2 is optional
+    gmpy2 = None
+
+BACKENDS = ("gmpy2", "python")
+
+BACKEND = None
+mpz = int
+
+
+def _python_powmod(base: int, exp: int, mod: int) -> int:
+    return pow(base, exp, mod)
+
+
+def _python_invert(a: int, mod: int) -> int:
+    try:
+        return pow(a, -1, mod)
+    except ValueError:
+        raise ValueError("Value is not invertible modulo mod") from None
+
+
+def _gmpy2_powmod(base: int, exp: int, mod: int) -> int:
+    return int(gmpy2.powmod(base, exp, mod))
+
+
+def _gmpy2_invert(a: int, mod: int) -> int:
+    # gmpy2 raises ZeroDivisionError where pow(a, -1, mod) raises ValueError
+    try:
+        return int(gmpy2.invert(a, mod))
+    except ZeroDivisionError:
+        raise ValueError("Value is not invertible modulo mod") from None
+
+
+def _python_is_prime(n: int) -> bool:
+    return isPrime(n)
+
+
+def _gmpy2_is_prime(n: int) -> bool:
+    return bool(gmpy2.is_prime(n, 25))
+
+
+powmod = _python_powmod
+invert = _python_invert
+is_prime = _python_is_prime
+
+
+def use_backend(name: str):
+    """
+    Selects the arithmetic backend ("gmpy2" or "python").
+
+    Raises ValueError for an unknown name and ImportError if gmpy2 is
+    requested but not installed.
+    """
+    global BACKEND, mpz, powmod, invert, is_prime
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown arithmetic backend: {name}")
+    if name == "gmpy2":
+        if gmpy2 is None:
+            raise ImportError("The gmpy2 backend requires gmpy2")
+        mpz, powmod, invert, is_prime = gmpy2.mpz, _gmpy2_powmod, _gmpy2_invert, _gmpy2_is_prime
+    else:
+        mpz, powmod, invert, is_prime = int, _python_powmod, _python_invert, _python_is_prime
+    BACKEND = name
+
+
+def batch_inverse(values, mod: int):
+    """
+    Inverts every value modulo mod with a single modular inversion
+    (Montgomery's trick: 3(n-1) multiplications instead of n inversions).
+
+    Raises ValueError if one of the values is not invertible.
+    """
+    prefix = []
+    acc = 1
+    for v in values:
+        acc = acc * v % mod
+        prefix.append(acc)
+    inv = invert(acc, mod)
+    inverses = [0] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        inverses[i] = inv * prefix[i - 1] % mod
+        inv = inv * values[i] % mod
+    if values:
+        inverses[0] = inv
+    return inverses
+
+
+use_backend(os.environ.get("ABE_ARITH_BACKEND") or ("gmpy2" if gmpy2 is not None else "python"))
@@ -0,0 +1,130 @@
+"""
+Micro-benchmarks for the crypto primitives used by the IBE and ABE servers.
+
+Usage:
+    python benchmark.py
+"""
+
+import os
+import random
+import time
+
+import arith
+from abe import CPABE, FixedBase
+from cocks import Cocks, CocksPKG
+
+# Message sizes (in bytes) used for the Cocks benchmarks
+COCKS_SIZES = [64, 1024, 16 * 1024]
+
+# Iterations per operation for the arithmetic backend benchmarks
+ARITH_ROUNDS = 2000
+
+# Sizes of q (in bits) used for the CP-ABE parameter generation benchmark
+ABE_SETUP_SIZES = [256, 512, 1024]
+
+
+def timed(fn, *args):
+    """
+    Runs fn(*args) once and returns (result, elapsed seconds).
+    """
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_cocks_encrypt(pkg, sizes=COCKS_SIZES):
+    """
+    Compares the per-bit Cocks encryption with the batched-inversion path.
+    """
+    r, a = pkg.extract("bench")
+    cocks = Cocks(pkg.n)
+
+    print("Cocks encrypt: per-bit vs batch inversion")
+    print(f"{'size':>8} {'per-bit (s)':>12} {'batch (s)':>12} {'speedup':>8}")
+    for size in sizes:
+        msg = bytes(size)
+        c_bit, t_bit = timed(cocks.encrypt, msg, a)
+        c_batch, t_batch = timed(cocks.encrypt_batch, msg, a)
+        assert cocks.decrypt(c_bit, r, a) == msg
+        assert cocks.decrypt(c_batch, r, a) == msg
+        print(f"{size:>8} {t_bit:>12.3f} {t_batch:>12.3f} {t_bit / t_batch:>7.2f}x")
+
+
+def per_op(fn, args, rounds=ARITH_ROUNDS):
+    """
+    Returns the mean time in microseconds of fn(*a) over the argument list.
+    """
+    start = time.perf_counter()
+    for _ in range(rounds // len(args)):
+        for a in args:
+            fn(*a)
+    return (time.perf_counter() - start) / (rounds // len(args) * len(args)) * 1e6
+
+
+def _arith_ops(cpabe):
+    """
+    Operations of the ABE arithmetic backend, with their arguments.
+    """
+    p, q, g = cpabe.p, cpabe.q, cpabe.g
+    rng = random.Random(1)
+    exps = [(g, rng.randrange(1, q), p) for _ in range(16)]
+    invs = [(rng.randrange(1, q), q) for _ in range(16)]
+    batches = [([rng.randrange(1, q) for _ in range(8)], q) for _ in range(16)]
+    base = FixedBase(g, p, q)
+    fixed = [(e,) for _, e, _ in exps]
+    return [
+        ("powmod", lambda *a: arith.powmod(*a), exps),
+        ("invert", lambda *a: arith.invert(*a), invs),
+        ("batch_inverse(8)", lambda *a: arith.batch_inverse(*a), batches),
+        ("fixed-base pow", lambda e: FixedBase.pow(base, e), fixed),
+    ]
+
+
+def bench_abe_arith(cpabe):
+    """
+    Compares the pure-Python and gmpy2 arithmetic backends, per operation.
+    """
+    if arith.gmpy2 is None:
+        print("ABE arithmetic: gmpy2 not installed, nothing to compare")
+        return
+
+    # Parity between the backends is checked by test_arith.py
+    default = arith.BACKEND
+    timings = {}
+    try:
+        for name in arith.BACKENDS:
+            arith.use_backend(name)
+            ops = _arith_ops(cpabe)
+            timings[name] = [per_op(fn, args) for _, fn, args in ops]
+    finally:
+        arith.use_backend(default)
+
+    print(f"ABE arithmetic ({cpabe.p.bit_length()}-bit p): python vs gmpy2")
+    print(f"{'operation':>18} {'python (us)':>12} {'gmpy2 (us)':>12} {'speedup':>8}")
+    for i, (label, _, _) in enumerate(ops):
+        t_py, t_gmp = timings["python"][i], timings["gmpy2"][i]
+        print(f"{label:>18} {t_py:>12.2f} {t_gmp:>12.2f} {t_py / t_gmp:>7.2f}x")
+
+
+def bench_abe_setup(sizes=ABE_SETUP_SIZES, workers=None):
+    """
+    Times CP-ABE parameter generation (sieved safe-prime search) against
+    rebuilding a CPABE from stored parameters.
+    """
+    workers = workers or os.cpu_count()
+    print(f"CP-ABE parameters: generation ({workers} workers) vs from_params")
+    print(f"{'q bits':>8} {'generate (s)':>13} {'from_params (us)':>17}")
+    for bits in sizes:
+        cpabe, t_gen = timed(lambda: CPABE(bits, workers=workers))
+        assert cpabe.p == 2 * cpabe.q + 1 and cpabe.q.bit_length() == bits
+        _, t_load = timed(CPABE.from_params, cpabe.p, cpabe.q, cpabe.g)
+        print(f"{bits:>8} {t_gen:>13.3f} {t_load * 1e6:>17.1f}")
+
+
+if __name__ == "__main__":
+    pkg = CocksPKG()
+    bench_cocks_encrypt(pkg)
+    print()
+    bench_abe_arith(CPABE())
+    print()
+    bench_abe_setup()
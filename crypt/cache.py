@@ -0,0 +1,146 @@
+"""
+Bounded LRU cache with optional time-to-live, shared by the ABE server.
+
+Unlike functools.lru_cache, entries are inserted explicitly (the value is
+not a function of the key alone) and can expire. Access is thread-safe so
+the cache can be used from Flask request threads.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class LRUCache:
+    """
+    Least-recently-used cache with an optional TTL.
+
+    Parameters:
+        maxsize: maximum number of entries kept (0 disables the cache)
+        ttl: lifetime of an entry in seconds, counted from its insertion
+             (None or 0 = no expiry)
+        on_evict: optional callback called with (key, value) when an entry
+                  is evicted, expires or is cleared
+
+    Expired entries are swept on every get and put, not only when their
+    own key is looked up again, so on_evict runs for them soon after
+    they expire.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # (expiry, key) in insertion order, i.e. in expiry order since the TTL is fixed;
+        # hits reorder _entries, so expired entries are found through this queue
+        self._expiries = deque()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for key, or default if it is missing or
+        has expired. A hit moves the entry to the most-recently-used end.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Inserts or replaces the value stored for key, evicting the least
+        recently used entries beyond maxsize.
+        """
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._expire()
+            if key in self._entries:
+                self._drop(key, count=False)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+            if expires is not None:
+                self._expiries.append((expires, key))
+                if len(self._expiries) > 2 * max(self.maxsize, len(self._entries)):
+                    # Queue full of replaced or evicted entries: rebuilt from the live ones
+                    self._expiries = deque(sorted(
+                        ((e, k) for k, (_, e) in self._entries.items()), key=lambda item: item[0]))
+
+    def pop(self, key):
+        """
+        Removes key from the cache. Returns True if it was present.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._drop(key, count=False)
+            return True
+
+    def expire(self):
+        """
+        Drops every expired entry now (also done on each get and put).
+        """
+        with self._lock:
+            self._expire()
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key, count=False)
+            self._expiries.clear()
+
+    def stats(self):
+        """
+        Returns the cache counters as a dict.
+        """
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def _expire(self):
+        # Called with the lock held
+        now = time.monotonic()
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= now:
+            expires, key = expiries.popleft()
+            entry = self._entries.get(key)
+            # Skip queue items left behind by entries since replaced or removed
+            if entry is not None and entry[1] == expires:
+                self._drop(key)
+
+    def _drop(self, key, count=True):
+        # Called with the lock held
+        value, _ = self._entries.pop(key)
+        if count:
+            self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+
+_MISSING = object()
@@ -7,25 +7,112 @@ Helpful resources:
 2. "Cocks IBE scheme", Wikipedia. https://en.wikipedia.org/wiki/Cocks_IBE_scheme
 """
 
+import os
 import random
+import struct
 import gmpy2
 import logging
+import threading
 
 import bitarray
 
 from bitarray import bitarray
-from hashlib import sha512
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from hashlib import sha256, sha512
+from itertools import repeat
+from Cryptodome.Cipher import AES
+from Cryptodome.Random import get_random_bytes
 from utils import *
+import primes
+import stream as aead_stream
 
 __author__ = "Carlton Shepherd"
 
 prng = random.SystemRandom()
-random_state = gmpy2.random_state()
 logger = logging.getLogger()
 
+# gmpy2 random states used to sample t; see _random_state
+_local = threading.local()
+
+# Ciphertext version tags
+VERSION_BITWISE = 1  # Every message bit encrypted with Cocks
+VERSION_HYBRID = 2   # Cocks-encrypted AES key + AES-GCM payload
+VERSION_MULTI = 3    # AES key encrypted once per recipient + shared AES-GCM payload
+VERSION_STREAM = 4   # Cocks-encrypted AES key + segmented AES-GCM payload (see stream.py)
+
+# Size of the identity hash labelling each recipient's key slot
+SLOT_ID_LEN = 8
+
+# Binary ciphertext format (big-endian):
+#   magic "CK" | version (1 byte) | limb width in bytes (2 bytes) | bit count (4 bytes)
+#   then, for each bit, c1 || c2 as fixed-width limbs,
+#   then, for hybrid ciphertexts, nonce (16 bytes) || tag (16 bytes) || AES-GCM ciphertext
+# Multi-recipient ciphertexts store the key bit count in the header, followed by
+#   recipient count (2 bytes), then for each recipient: slot id || c1 || c2 limbs,
+#   then nonce || tag || AES-GCM ciphertext
+# Streamed ciphertexts hold the key limbs followed by the segmented payload from stream.py
+MAGIC = b"CK"
+HEADER = struct.Struct(">2sBHI")
+RECIPIENTS = struct.Struct(">H")
+GCM_NONCE_LEN = 16
+GCM_TAG_LEN = 16
+
+def _prime_window(n_bits):
+    """
+    Scans one sieve window (see primes.py) for an n-bit prime congruent to 3 mod 4.
+
+    The two top bits are set, so that the product of two such primes
+    has exactly 2 * n_bits bits.
+
+    Parameters:
+        n_bits : Desired prime size (in bits)
+
+    Returns:
+        An n-bit prime p with p % 4 == 3, or None if the window holds none
+    """
+    start = prng.getrandbits(n_bits) | (3 << (n_bits - 2))
+    start += 3 - start % 4
+    for candidate in primes.sieve(start, 4):
+        candidate = gmpy2.mpz(candidate)
+        if candidate.bit_length() != n_bits:
+            return None
+        if gmpy2.is_prime(candidate, 25):
+            return candidate
+    return None
+
+
+def _find_prime(n_bits):
+    """
+    Sieve-based search for an n-bit prime congruent to 3 mod 4.
+
+    Parameters:
+        n_bits : Desired prime size (in bits)
+
+    Returns:
+        An n-bit prime p with p % 4 == 3
+    """
+    return primes.search(_prime_window, (n_bits,))[0]
+
+
+def _find_prime_pair(n_bits, workers):
+    """
+    Searches for two distinct primes, with windows spread over worker processes.
+
+    Parameters:
+        n_bits : Desired prime size (in bits)
+        workers : Number of worker processes
+
+    Returns:
+        (p, q) : Two distinct n-bit primes congruent to 3 mod 4
+    """
+    p, q = primes.search(_prime_window, (n_bits,), count=2, workers=workers)
+    return p, q
+
 
 class CocksPKG:
-    def __init__(self, n_len=2048, f=sha512):
+    def __init__(self, n_len=2048, f=sha512, cache_size=1024, p=None, q=None, n=None, workers=None):
         """
         Initialises the Cocks public key generator (PKG).
 
@@ -33,17 +120,69 @@ class CocksPKG:
         provide your own by setting f to another method,
         e.g. Blake2, SHA3, etc.
 
+        When p and q are given, no primes are generated and only the
+        derived values are computed, which takes well under a millisecond.
+
         Parameters:
             n_len : Modulus size
             f : Hash function for hashing ID values.
+            cache_size : Number of extracted keys kept in the LRU cache
+            p, q, n : Existing PKG parameters (optional)
+            workers : Processes used to generate fresh primes (default: number of cores)
         """
         self.n_len = n_len
         self.f = f
-        self.p, self.q, self.n = self._setup()
+        self._extract_cached = lru_cache(maxsize=cache_size)(self._extract)
+        if p is not None and q is not None:
+            self.set_params(p, q, n)
+        else:
+            self.p, self.q, self.n = self._setup(workers)
+            self._precompute()
+
+    @classmethod
+    def from_params(cls, p, q, n=None, **kwargs):
+        """
+        Builds a PKG from existing parameters, without generating primes.
+
+        Parameters:
+            p, q : Primes congruent to 3 mod 4
+            n : Modulus p*q (computed if omitted)
+
+        Returns:
+            pkg : CocksPKG instance
+        """
+        return cls(p=p, q=q, n=n, **kwargs)
+
+    def _precompute(self):
+        """
+        Precomputes the values used by extract that only depend on p and q:
+        the square-root exponent, its reductions mod p-1 and q-1, and the
+        CRT coefficient q^-1 mod p.
+        """
+        self.exp = (self.n + 5 - self.p - self.q) // 8
+        self.exp_p = self.exp % (self.p - 1)
+        self.exp_q = self.exp % (self.q - 1)
+        self.q_inv = gmpy2.invert(self.q, self.p)
+
+    def set_params(self, p, q, n=None):
+        """
+        Replaces the PKG's primes, recomputing the derived values
+        and dropping previously extracted keys.
+
+        Parameters:
+            p, q : Primes congruent to 3 mod 4
+            n : Modulus p*q (computed if omitted)
+        """
+        self.p = gmpy2.mpz(p)
+        self.q = gmpy2.mpz(q)
+        self.n = gmpy2.mpz(n) if n is not None else self.p * self.q
+        self.n_len = self.n.bit_length()
+        self._precompute()
+        self._extract_cached.cache_clear()
 
     def _gen_prime(self, n_bits):
         """
-        Generates an n-bit prime.
+        Generates an n-bit prime congruent to 3 mod 4.
         
         Parameters:
             n_bits : Desired prime size (in bits)
@@ -51,23 +190,17 @@ class CocksPKG:
         Returns:
             An n-bit prime
         """
-        n = gmpy2.mpz(prng.getrandbits(n_bits))
-        return gmpy2.next_prime(n)
+        return _find_prime(n_bits)
 
-    def _setup(self):
+    def _setup(self, workers=None):
         """
         Generates two distinct primes, p and q, congruent
         to 3 mod 4, and its product, n, the scheme's modulus.
+
+        The prime searches run in parallel when several workers are available.
         """
-        n, p, q = 0, 0, 0
-        while n.bit_length() != self.n_len:
-            p = q = 0
-            while p % 4 != 3:
-                p = self._gen_prime(self.n_len // 2)
-            while p == q or q % 4 != 3:
-                q = self._gen_prime(self.n_len // 2)
-            n = p * q
-        return p, q, n
+        p, q = _find_prime_pair(self.n_len // 2, workers or os.cpu_count())
+        return p, q, p * q
 
     def extract(self, id_str):
         """
@@ -85,17 +218,31 @@ class CocksPKG:
         if id_str == "" or id_str is None:
             raise InvalidIdentityString("Invalid user identity string")
 
+        return self._extract_cached(id_str)
+
+    def _extract(self, id_str):
+        """
+        Uncached key extraction; see extract.
+        """
+        p, q = self.p, self.q
+
         # Convert the string to an mpz using a helper function, and reduce it modulo n.
         a = hash_mpz(str_to_mpz(id_str), self.f) % self.n
 
         # Ensure that a is nonzero, within [0, n-1], coprime to n, and that its Jacobi symbol is 1.
         # This guarantees that a is a valid candidate for the square-root extraction.
-        while a == 0 or gmpy2.gcd(a, self.n) != 1 or gmpy2.jacobi(a, self.n) != 1:
+        # (a|n) = (a|p)(a|q), and a Legendre symbol of 0 means a shares a factor with n.
+        jp, jq = gmpy2.legendre(a, p), gmpy2.legendre(a, q)
+        while a == 0 or jp * jq != 1:
             a = hash_mpz(a, self.f) % self.n
+            jp, jq = gmpy2.legendre(a, p), gmpy2.legendre(a, q)
 
-        exp = (self.n + 5 - self.p - self.q) // 8
-        base = a if gmpy2.jacobi(a, self.p) == 1 and gmpy2.jacobi(a, self.q) == 1 else -a
-        r = gmpy2.powmod(base, exp, self.n)
+        base = a if jp == 1 else -a
+
+        # r = base^exp mod n, computed as two half-size exponentiations recombined with CRT
+        r_p = gmpy2.powmod(base % p, self.exp_p, p)
+        r_q = gmpy2.powmod(base % q, self.exp_q, q)
+        r = r_q + q * ((r_p - r_q) * self.q_inv % p)
 
         # Assert result
         if gmpy2.cmp(gmpy2.powmod(r, 2, self.n), base % self.n) != 0:
@@ -104,15 +251,168 @@ class CocksPKG:
         return r, base
 
 
+def _random_state():
+    """
+    Returns the calling thread's gmpy2 random state.
+
+    gmpy2.random_state() without a seed always starts from the same fixed
+    seed, so its t sequence could be replayed by anyone. Each thread gets
+    its own state, seeded from the OS CSPRNG on first use and again in
+    a forked child.
+    """
+    state = getattr(_local, "state", None)
+    if state is None or _local.pid != os.getpid():
+        state = _seed_random_state()
+    return state
+
+
+def _seed_random_state():
+    """
+    Replaces the calling thread's gmpy2 random state with a freshly seeded one.
+
+    A forked process inherits its parent's state; without a new seed, every
+    worker would replay the same t sequence.
+    """
+    _local.state = gmpy2.random_state(prng.getrandbits(128))
+    _local.pid = os.getpid()
+    return _local.state
+
+
+class CocksRandomPool:
+    def __init__(self, n, size=4096, low_water=None):
+        """
+        Pool of precomputed (t, t^-1 mod n) pairs used for bit encryption.
+
+        The pairs do not depend on the message, so they are produced ahead
+        of time by a background thread and kept in two bounded pools, one
+        per Jacobi symbol (+1 and -1). The thread sleeps while both pools
+        are above the low-water mark and tops them up to `size` otherwise.
+
+        Parameters:
+            n : Public modulus generated by the PKG
+            size : Maximum number of pairs kept per Jacobi symbol
+            low_water : Pool length under which a refill is triggered (default: size // 2)
+        """
+        self.n = n
+        self.size = size
+        self.low_water = size // 2 if low_water is None else low_water
+        self.hits = 0
+        self.misses = 0
+        self._pools = {1: deque(), -1: deque()}
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._refill, name="cocks-random-pool", daemon=True)
+        self._thread.start()
+
+    def _needs_refill(self):
+        return any(len(pool) < self.low_water for pool in self._pools.values())
+
+    def _refill(self):
+        """
+        Background loop: waits until a pool runs low, then fills both pools up to size.
+        """
+        state = gmpy2.random_state(prng.getrandbits(128))
+        while True:
+            with self._cond:
+                while not self._stopped and not self._needs_refill():
+                    self._cond.wait()
+                if self._stopped:
+                    return
+
+            while not self._stopped:
+                t = gmpy2.mpz_random(state, self.n)
+                j = gmpy2.jacobi(t, self.n)
+                if j == 0:
+                    continue
+                pool = self._pools[j]
+                if len(pool) >= self.size:
+                    if all(len(p) >= self.size for p in self._pools.values()):
+                        break
+                    continue
+                pool.append((t, gmpy2.invert(t, self.n)))
+
+    def take(self, m_bit):
+        """
+        Pops a precomputed pair whose Jacobi symbol equals m_bit.
+
+        Parameters:
+            m_bit : Jacobi symbol in {-1,1}
+
+        Returns:
+            (t, t^-1 mod n), or None if the pool is empty
+        """
+        pool = self._pools[m_bit]
+        try:
+            pair = pool.popleft()
+            self.hits += 1
+        except IndexError:
+            pair = None
+            self.misses += 1
+
+        if len(pool) < self.low_water:
+            with self._cond:
+                self._cond.notify()
+        return pair
+
+    def stop(self):
+        """
+        Stops the background producer and waits for its thread to exit,
+        so that the process can safely fork afterwards.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+
 class Cocks:
-    def __init__(self, n):
+    def __init__(self, n, pool=None):
         """
         Initialises the Cocks scheme (user-side).
 
         Parameters:
             n : Public modulus generated by the PKG
+            pool : Optional CocksRandomPool built for the same modulus
         """
         self.n = n
+        self.pool = pool
+
+    def _draw_t(self, m_bit):
+        """
+        Draws a random t with (t|n) == m_bit, along with t^-1 mod n.
+
+        Pairs are taken from the precomputed pool when one is available,
+        and sampled on the spot otherwise.
+
+        Parameters:
+            m_bit : Message bit in {-1,1}
+
+        Returns:
+            (t, t^-1 mod n)
+        """
+        if self.pool is not None:
+            pair = self.pool.take(m_bit)
+            if pair is not None:
+                return pair
+
+        t = self._sample_t(m_bit)
+        return t, gmpy2.invert(t, self.n)
+
+    def _sample_t(self, m_bit):
+        """
+        Samples a random t in [0, n-1] such that (t|n) == m_bit.
+
+        Parameters:
+            m_bit : Message bit in {-1,1}
+
+        Returns:
+            t : Random value with the requested Jacobi symbol
+        """
+        state = _random_state()
+        t = gmpy2.mpz_random(state, self.n)
+        while gmpy2.jacobi(t, self.n) != m_bit:
+            t = gmpy2.mpz_random(state, self.n)
+        return t
 
     def _encrypt_bit(self, m_bit, a):
         """
@@ -125,16 +425,13 @@ class Cocks:
         Returns:
             (c1, c2) : Ciphertext tuple
         """
-        t1 = t2 = gmpy2.mpz_random(random_state, self.n)
-
-        while gmpy2.jacobi(t1, self.n) != m_bit:
-            t1 = gmpy2.mpz_random(random_state, self.n)
+        t1, t1_inv = self._draw_t(m_bit)
+        t2, t2_inv = self._draw_t(m_bit)
+        while t1 == t2:
+            t2, t2_inv = self._draw_t(m_bit)
 
-        while gmpy2.jacobi(t2, self.n) != m_bit or t1 == t2:
-            t2 = gmpy2.mpz_random(random_state, self.n)
-
-        c1 = (t1 + a * gmpy2.invert(t1, self.n)) % self.n
-        c2 = (t2 - a * gmpy2.invert(t2, self.n)) % self.n
+        c1 = (t1 + a * t1_inv) % self.n
+        c2 = (t2 - a * t2_inv) % self.n
         return c1, c2
 
     def encrypt(self, msg, a):
@@ -158,6 +455,56 @@ class Cocks:
         msg_arr = [1 if b else -1 for b in x]
         return [self._encrypt_bit(b, a) for b in msg_arr]
 
+    def encrypt_batch(self, msg, a):
+        """
+        Encrypts a byte array message, inverting all the t values at once.
+
+        Every t1/t2 of the message is sampled first (or taken from the
+        pool, already inverted); the remaining ones are then inverted with
+        a single modular inversion using Montgomery's trick. The output is
+        the same as encrypt.
+
+        Parameters:
+            msg : Message as a byte array
+            a : Hashed identity value
+
+        Returns:
+            c_list : List of ciphertext tuples for each encrypted bit
+        """
+        if type(msg) != bytes:
+            raise InvalidMessageType(
+                f"Expected msg with bytes type, but got {type(msg)}")
+
+        x = bitarray()
+        x.frombytes(msg)
+        # Transform message space: {0,1} -> {-1,1}
+        msg_arr = [1 if b else -1 for b in x]
+
+        # pairs[2i] and pairs[2i+1] hold (t1, t1^-1) and (t2, t2^-1) for bit i
+        pairs = []
+        missing = []
+        for b in msg_arr:
+            for _ in range(2):
+                pair = self.pool.take(b) if self.pool is not None else None
+                if pair is None:
+                    missing.append(len(pairs))
+                    pair = (self._sample_t(b), None)
+                pairs.append(pair)
+
+        inverses = batch_invert([pairs[i][0] for i in missing], self.n)
+        for i, t_inv in zip(missing, inverses):
+            pairs[i] = (pairs[i][0], t_inv)
+
+        c_list = []
+        for i, b in enumerate(msg_arr):
+            (t1, t1_inv), (t2, t2_inv) = pairs[2 * i], pairs[2 * i + 1]
+            while t1 == t2:
+                t2, t2_inv = self._draw_t(b)
+            c1 = (t1 + a * t1_inv) % self.n
+            c2 = (t2 - a * t2_inv) % self.n
+            c_list.append((c1, c2))
+        return c_list
+
     def _decrypt_bit(self, c1, c2, r, a):
         """
         Decrypts an individual message bit from a ciphertext tuple,
@@ -188,8 +535,503 @@ class Cocks:
         Returns:
             x : Decrypted byte array
         """
-        bit_list = [self._decrypt_bit(c1, c2, r, a) for (c1, c2) in c_list]
+        return CocksDecryptor(self.n, r, a).decrypt(c_list)
+
+    def encrypt_hybrid(self, msg, a, key_len=32):
+        """
+        Encrypts a byte array message using a hybrid (KEM/DEM) construction.
+
+        A fresh AES key is encrypted bit-by-bit with Cocks, and the
+        message itself is encrypted with AES-GCM under that key. The
+        number of Cocks operations is therefore 8 * key_len, whatever
+        the message size.
+
+        Parameters:
+            msg : Message as a byte array
+            a : Hashed identity value
+            key_len : AES key size in bytes (16 or 32)
+
+        Returns:
+            ct : Dict holding the version tag, the encrypted key and the AES-GCM payload
+        """
+        key, payload = self._seal(msg, key_len)
+        return {
+            'version': VERSION_HYBRID,
+            'key': self.encrypt_batch(key, a),
+            **payload,
+        }
+
+    def encrypt_multi(self, msg, a_list, key_len=32):
+        """
+        Encrypts a byte array message for several identities at once.
+
+        The message is encrypted a single time with AES-GCM, and only
+        the AES key is encrypted with Cocks for each recipient. Each key
+        slot is labelled with a hash of the recipient's identity value.
+
+        Parameters:
+            msg : Message as a byte array
+            a_list : Hashed identity values of the recipients
+            key_len : AES key size in bytes (16 or 32)
+
+        Returns:
+            ct : Dict holding the version tag, the key slots and the AES-GCM payload
+        """
+        if not a_list:
+            raise InvalidIdentityString("At least one recipient is required")
+
+        key, payload = self._seal(msg, key_len)
+        # dict.fromkeys drops duplicate recipients while keeping their order
+        slots = [(slot_id(a), self.encrypt_batch(key, a)) for a in dict.fromkeys(a_list)]
+        return {
+            'version': VERSION_MULTI,
+            'slots': slots,
+            **payload,
+        }
+
+    def encrypt_stream(self, chunks, a, key_len=32):
+        """
+        Encrypts a stream of byte chunks without holding it in memory.
+
+        The AES key is encrypted with Cocks as in encrypt_hybrid, and the
+        payload is encrypted segment by segment (see stream.py), so output
+        is produced before the input has been fully read.
+
+        Parameters:
+            chunks : Iterable of byte arrays
+            a : Hashed identity value
+            key_len : AES key size in bytes (16 or 32)
+
+        Yields:
+            The serialised header and encrypted key, then the payload frames
+        """
+        if key_len not in (16, 32):
+            raise ValueError(f"Unsupported AES key size: {key_len} bytes")
+
+        key = get_random_bytes(key_len)
+        c_list = self.encrypt_batch(key, a)
+        width = (self.n.bit_length() + 7) // 8
+        yield b"".join([HEADER.pack(MAGIC, VERSION_STREAM, width, len(c_list)), *_limbs(c_list, width)])
+        yield from aead_stream.encrypt_stream(key, chunks)
+
+    def _seal(self, msg, key_len):
+        """
+        Encrypts msg with AES-GCM under a fresh random key.
+
+        Returns:
+            (key, payload) : AES key and dict with the nonce, tag and ciphertext
+        """
+        if type(msg) != bytes:
+            raise InvalidMessageType(
+                f"Expected msg with bytes type, but got {type(msg)}")
+        if key_len not in (16, 32):
+            raise ValueError(f"Unsupported AES key size: {key_len} bytes")
+
+        key = get_random_bytes(key_len)
+        cipher = AES.new(key, AES.MODE_GCM)
+        ciphertext, tag = cipher.encrypt_and_digest(msg)
+        return key, {'nonce': cipher.nonce, 'tag': tag, 'ciphertext': ciphertext}
+
+    def decrypt_hybrid(self, ct, r, a):
+        """
+        Decrypts a hybrid ciphertext produced by encrypt_hybrid.
+
+        Parameters:
+            ct : Hybrid ciphertext dict
+            r : User's secret key
+            a : Hashed identity value
+
+        Returns:
+            x : Decrypted byte array
+        """
+        return CocksDecryptor(self.n, r, a).decrypt_hybrid(ct)
+
+
+def slot_id(a):
+    """
+    Hashes an identity value into the label of its key slot.
+
+    Parameters:
+        a : Hashed identity value
+
+    Returns:
+        Slot label (SLOT_ID_LEN bytes)
+    """
+    return sha256(gmpy2.digits(a, 16).encode("utf-8")).digest()[:SLOT_ID_LEN]
+
+
+class CocksDecryptor:
+    def __init__(self, n, r, a):
+        """
+        Decryption context bound to a single user key (r, a).
+
+        Everything that only depends on the key is computed once: which
+        ciphertext component applies (c1 if r^2 == a mod n, c2 otherwise)
+        and 2r. Decrypting a bit is then one addition and one Jacobi symbol.
+
+        Parameters:
+            n : Public modulus generated by the PKG
+            r : User's secret key
+            a : Hashed identity value
+        """
+        self.n = n
+        self.r = r
+        self.a = a
+        # Index of the ciphertext component to use: c1 (0) or c2 (1)
+        self.component = 0 if (r * r) % n == a % n else 1
+        self.two_r = 2 * r
+        self.slot_id = slot_id(a)
+
+    def decrypt(self, c_list):
+        """
+        Decrypts a list of ciphertext tuples to a byte array.
+
+        Parameters:
+            c_list : List of ciphertext tuples
+
+        Returns:
+            x : Decrypted byte array
+        """
+        i, two_r, n = self.component, self.two_r, self.n
         # Transform message space: {-1,1} -> {0,1}
-        msg_arr = [0 if b < 0 else b for b in bit_list]
-        x = bitarray(msg_arr)
-        return x.tobytes()
\ No newline at end of file
+        x = bitarray([gmpy2.jacobi(c[i] + two_r, n) == 1 for c in c_list])
+        return x.tobytes()
+
+    def decrypt_hybrid(self, ct):
+        """
+        Decrypts a hybrid ciphertext produced by Cocks.encrypt_hybrid.
+
+        Parameters:
+            ct : Hybrid ciphertext dict
+
+        Returns:
+            x : Decrypted byte array
+        """
+        return self._open(self.decrypt(ct['key']), ct)
+
+    def decrypt_multi(self, ct):
+        """
+        Decrypts a multi-recipient ciphertext produced by Cocks.encrypt_multi,
+        using the key slot labelled with this identity.
+
+        Parameters:
+            ct : Multi-recipient ciphertext dict
+
+        Returns:
+            x : Decrypted byte array
+        """
+        for label, c_list in ct['slots']:
+            if label == self.slot_id:
+                return self._open(self.decrypt(c_list), ct)
+        raise DecryptionFailure("No key slot for this identity")
+
+    def decrypt_stream(self, stream, segment_size=aead_stream.SEGMENT_SIZE):
+        """
+        Decrypts a binary ciphertext read from a file-like object, yielding
+        the plaintext piece by piece with bounded memory.
+
+        Streamed (VERSION_STREAM) and bitwise (VERSION_BITWISE) ciphertexts
+        are supported.
+
+        Parameters:
+            stream : Readable binary stream
+            segment_size : Plaintext bytes yielded at a time for bitwise ciphertexts
+
+        Yields:
+            Decrypted byte arrays
+        """
+        version, width, count = read_header(stream)
+        c_tuples = iter_ciphertext(stream, width, count)
+
+        if version == VERSION_STREAM:
+            key = self.decrypt(list(c_tuples))
+            yield from aead_stream.decrypt_stream(key, stream)
+        elif version == VERSION_BITWISE:
+            i, two_r, n = self.component, self.two_r, self.n
+            x = bitarray()
+            for c in c_tuples:
+                x.append(gmpy2.jacobi(c[i] + two_r, n) == 1)
+                if len(x) == 8 * segment_size:
+                    yield x.tobytes()
+                    x.clear()
+            yield x.tobytes()
+        else:
+            raise InvalidMessageType(f"Ciphertext version {version} cannot be decrypted as a stream")
+
+    def _open(self, key, ct):
+        """
+        Decrypts and authenticates the AES-GCM payload of a hybrid or multi-recipient ciphertext.
+        """
+        try:
+            cipher = AES.new(key, AES.MODE_GCM, nonce=ct['nonce'])
+            return cipher.decrypt_and_verify(ct['ciphertext'], ct['tag'])
+        except ValueError as e:
+            raise DecryptionFailure("AES-GCM authentication failed: wrong key or corrupted ciphertext") from e
+
+    def decrypt_many(self, c_lists):
+        """
+        Decrypts several ciphertext tuple lists for the same user in one pass.
+
+        Parameters:
+            c_lists : List of ciphertext tuple lists
+
+        Returns:
+            List of decrypted byte arrays, in the same order
+        """
+        return [self.decrypt(c_list) for c_list in c_lists]
+
+
+def _limbs(c_list, width):
+    """
+    Yields the fixed-width big-endian encoding of each c1 and c2.
+    """
+    for c1, c2 in c_list:
+        yield c1.to_bytes(width, 'big')
+        yield c2.to_bytes(width, 'big')
+
+
+def pack_ciphertext(ct, n):
+    """
+    Serialises a ciphertext to the compact binary format.
+
+    Parameters:
+        ct : List of ciphertext tuples (bitwise), or hybrid or multi-recipient ciphertext dict
+        n : Public modulus, which fixes the limb width
+
+    Returns:
+        data : Serialised ciphertext
+    """
+    width = (n.bit_length() + 7) // 8
+
+    if not isinstance(ct, dict):
+        return b"".join([HEADER.pack(MAGIC, VERSION_BITWISE, width, len(ct)), *_limbs(ct, width)])
+
+    if ct['version'] == VERSION_HYBRID:
+        parts = [HEADER.pack(MAGIC, VERSION_HYBRID, width, len(ct['key'])), *_limbs(ct['key'], width)]
+    else:
+        slots = ct['slots']
+        parts = [HEADER.pack(MAGIC, VERSION_MULTI, width, len(slots[0][1])), RECIPIENTS.pack(len(slots))]
+        for label, c_list in slots:
+            parts.append(label)
+            parts.extend(_limbs(c_list, width))
+    parts += [ct['nonce'], ct['tag'], ct['ciphertext']]
+    return b"".join(parts)
+
+
+def unpack_ciphertext(data):
+    """
+    Deserialises a ciphertext from the compact binary format.
+
+    Limbs are decoded straight from memoryview slices, without copies.
+
+    Parameters:
+        data : Serialised ciphertext
+
+    Returns:
+        ct : List of ciphertext tuples (bitwise), or hybrid or multi-recipient ciphertext dict
+    """
+    mv = memoryview(data)
+    magic, version, width, count = HEADER.unpack_from(mv)
+    if magic != MAGIC or version not in (VERSION_BITWISE, VERSION_HYBRID, VERSION_MULTI):
+        raise InvalidMessageType("Not a Cocks ciphertext")
+
+    from_bytes = gmpy2.mpz.from_bytes
+
+    def read_limbs(offset):
+        end = offset + 2 * width * count
+        if len(mv) < end:
+            raise InvalidMessageType("Truncated Cocks ciphertext")
+        c_list = [
+            (from_bytes(mv[o:o + width], 'big'), from_bytes(mv[o + width:o + 2 * width], 'big'))
+            for o in range(offset, end, 2 * width)
+        ]
+        return c_list, end
+
+    offset = HEADER.size
+    if version == VERSION_BITWISE:
+        return read_limbs(offset)[0]
+
+    if version == VERSION_HYBRID:
+        c_list, offset = read_limbs(offset)
+        ct = {'version': VERSION_HYBRID, 'key': c_list}
+    else:
+        (recipients,) = RECIPIENTS.unpack_from(mv, offset)
+        offset += RECIPIENTS.size
+        slots = []
+        for _ in range(recipients):
+            label = bytes(mv[offset:offset + SLOT_ID_LEN])
+            c_list, offset = read_limbs(offset + SLOT_ID_LEN)
+            slots.append((label, c_list))
+        ct = {'version': VERSION_MULTI, 'slots': slots}
+
+    tag_end = offset + GCM_NONCE_LEN + GCM_TAG_LEN
+    ct['nonce'] = bytes(mv[offset:offset + GCM_NONCE_LEN])
+    ct['tag'] = bytes(mv[offset + GCM_NONCE_LEN:tag_end])
+    ct['ciphertext'] = bytes(mv[tag_end:])
+    return ct
+
+
+def is_packed_ciphertext(data):
+    """
+    Tells binary ciphertexts apart from legacy pickled ones.
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+
+def read_header(stream):
+    """
+    Reads the header of a binary ciphertext from a file-like object.
+
+    Parameters:
+        stream : Readable binary stream
+
+    Returns:
+        (version, width, count) : Version tag, limb width in bytes and number of bits
+    """
+    header = stream.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise InvalidMessageType("Truncated Cocks ciphertext")
+    magic, version, width, count = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise InvalidMessageType("Not a Cocks ciphertext")
+    return version, width, count
+
+
+def iter_ciphertext(stream, width, count):
+    """
+    Yields the ciphertext tuples of a binary ciphertext one by one,
+    reading from a stream positioned right after the header.
+
+    Parameters:
+        stream : Readable binary stream
+        width : Limb width in bytes
+        count : Number of ciphertext tuples
+
+    Yields:
+        (c1, c2) : Ciphertext tuple
+    """
+    from_bytes = gmpy2.mpz.from_bytes
+    for _ in range(count):
+        limbs = stream.read(2 * width)
+        if len(limbs) != 2 * width:
+            raise InvalidMessageType("Truncated Cocks ciphertext")
+        mv = memoryview(limbs)
+        yield from_bytes(mv[:width], 'big'), from_bytes(mv[width:], 'big')
+
+
+# Per-worker Cocks instance, set once by the process pool initializer
+_worker_cocks = None
+
+
+def _init_worker(n):
+    global _worker_cocks
+    _seed_random_state()
+    _worker_cocks = Cocks(gmpy2.mpz(n))
+
+
+def _worker_ready(_):
+    return os.getpid()
+
+
+def _encrypt_chunk(msg, a):
+    return _worker_cocks.encrypt_batch(msg, a)
+
+
+def _decrypt_chunk(c_list, r, a):
+    return CocksDecryptor(_worker_cocks.n, r, a).decrypt(c_list)
+
+
+class CocksEngine:
+    def __init__(self, n, workers=None, chunk_bytes=256):
+        """
+        Process-pool engine spreading Cocks work across cores.
+
+        Bits are independent, so a message is split into byte-aligned
+        chunks that are encrypted or decrypted in parallel. Workers are
+        started (and receive n) once, when the engine is created.
+
+        Parameters:
+            n : Public modulus generated by the PKG
+            workers : Number of worker processes (default: number of cores)
+            chunk_bytes : Plaintext bytes handled by a worker per task
+        """
+        self.n = n
+        self.workers = workers or os.cpu_count()
+        self.chunk_bytes = chunk_bytes
+        # Forked workers: under spawn or forkserver, each one would re-import the
+        # server module that creates the engine (see primes.fork_context)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=primes.fork_context(),
+            initializer=_init_worker, initargs=(str(n),))
+        # Warm the pool up so that the first request does not pay for the forks
+        list(self._executor.map(_worker_ready, range(self.workers)))
+
+    def encrypt(self, msg, a):
+        """
+        Encrypts a byte array message in parallel.
+
+        Parameters:
+            msg : Message as a byte array
+            a : Hashed identity value
+
+        Returns:
+            c_list : List of ciphertext tuples for each encrypted bit
+        """
+        if type(msg) != bytes:
+            raise InvalidMessageType(
+                f"Expected msg with bytes type, but got {type(msg)}")
+
+        chunks = [msg[i:i + self.chunk_bytes] for i in range(0, len(msg), self.chunk_bytes)]
+        c_list = []
+        for part in self._executor.map(_encrypt_chunk, chunks, repeat(a)):
+            c_list.extend(part)
+        return c_list
+
+    def decrypt(self, c_list, r, a):
+        """
+        Decrypts a list of ciphertext tuples in parallel.
+
+        Parameters:
+            c_list : List of ciphertext tuples
+            r : User's secret key
+            a : Hashed identity value
+
+        Returns:
+            x : Decrypted byte array
+        """
+        step = self.chunk_bytes * 8
+        chunks = [c_list[i:i + step] for i in range(0, len(c_list), step)]
+        return b"".join(self._executor.map(_decrypt_chunk, chunks, repeat(r), repeat(a)))
+
+    def encrypt_many(self, msgs, a_list):
+        """
+        Encrypts a batch of messages in parallel, one task per message.
+
+        Parameters:
+            msgs : List of messages as byte arrays
+            a_list : Hashed identity value for each message
+
+        Returns:
+            List of ciphertext tuple lists, in the same order
+        """
+        return list(self._executor.map(_encrypt_chunk, msgs, a_list))
+
+    def decrypt_many(self, c_lists, r, a):
+        """
+        Decrypts a batch of ciphertext tuple lists for the same user in parallel.
+
+        Parameters:
+            c_lists : List of ciphertext tuple lists
+            r : User's secret key
+            a : Hashed identity value
+
+        Returns:
+            List of decrypted byte arrays, in the same order
+        """
+        return list(self._executor.map(_decrypt_chunk, c_lists, repeat(r), repeat(a)))
+
+    def shutdown(self):
+        """
+        Stops the worker processes.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
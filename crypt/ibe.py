@@ -3,8 +3,12 @@ import gmpy2
 # import psycopg2
 # from psycopg2 import sql
 # from psycopg2.extras import execute_values
-from flask import Flask, app, jsonify, request
-from cocks import Cocks, CocksPKG
+from flask import Flask, Response, app, jsonify, request, stream_with_context
+from cocks import (Cocks, CocksDecryptor, CocksEngine, CocksPKG, CocksRandomPool, VERSION_HYBRID, VERSION_MULTI,
+                   pack_ciphertext, unpack_ciphertext, is_packed_ciphertext)
+from primes import fork_context
+from functools import lru_cache
+from itertools import chain
 from base64 import b64encode, b64decode
 from utils import *
 import pickle
@@ -12,15 +16,19 @@ import pickle
 from dotenv import load_dotenv
 import os
 import json
+import logging
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
 envKey = json.loads(b64decode(os.getenv("IBE_MASTER_KEY")))
 
 # Initialisation unique (au démarrage du serveur)
-global_pkg = CocksPKG()  # Génère p, q, et n
+# Construit à partir de IBE_MASTER_KEY : aucun nombre premier n'est généré au démarrage
+global_pkg = CocksPKG.from_params(envKey["p"], envKey["q"], envKey["n"])
 # Verifier la table cocks_pkg :
 # Si actif == 1 alors {
 #     global_pkg.n = gmpy2.mpz(n)
@@ -29,12 +37,66 @@ global_pkg = CocksPKG()  # Génère p, q, et n
 #     }
 # Il faut utiliser gmpy2.mpz() pour caster la donnee qui a ete dans la base et la recuperer dans une variable ici
 
-global_pkg.p = gmpy2.mpz(envKey["p"])
-global_pkg.q = gmpy2.mpz(envKey["q"])
-global_pkg.n = gmpy2.mpz(envKey["n"])
-
 global_n = global_pkg.n   # n est désormais global
 
+# Moteur multi-processus pour les gros chiffrés bit à bit
+# IBE_WORKERS : nombre de processus (0 = désactivé, valeur par défaut)
+# IBE_PARALLEL_THRESHOLD : taille du message clair (octets) à partir de laquelle on l'utilise
+IBE_WORKERS = int(os.getenv("IBE_WORKERS", "0"))
+IBE_PARALLEL_THRESHOLD = int(os.getenv("IBE_PARALLEL_THRESHOLD", "512"))
+
+def creer_moteur(n):
+    """
+    Crée le moteur parallèle pour le module n (None si désactivé).
+    """
+    if IBE_WORKERS <= 0:
+        return None
+    if fork_context() is None:
+        logger.warning("IBE_WORKERS ignoré : les processus du moteur nécessitent fork")
+        return None
+    return CocksEngine(n, IBE_WORKERS)
+
+# Créé avant le pool d'aléas pour ne pas forker pendant que son thread tourne
+global_engine = creer_moteur(global_n)
+
+# Pool de couples (t, t^-1 mod n) précalculés en tâche de fond pour /chiffrer
+# IBE_POOL_SIZE : nombre de couples gardés par symbole de Jacobi (0 = désactivé)
+IBE_POOL_SIZE = int(os.getenv("IBE_POOL_SIZE", "4096"))
+IBE_POOL_LOW_WATER = int(os.getenv("IBE_POOL_LOW_WATER", str(IBE_POOL_SIZE // 2)))
+
+def creer_pool(n):
+    """
+    Crée le pool d'aléas pour le module n (None si désactivé).
+    """
+    if IBE_POOL_SIZE <= 0:
+        return None
+    return CocksRandomPool(n, IBE_POOL_SIZE, IBE_POOL_LOW_WATER)
+
+global_pool = creer_pool(global_n)
+
+def arreter_precalculs():
+    """
+    Arrête le pool (son thread est attendu) et le moteur : plus aucun thread ne tourne
+    quand on forke ensuite (recherche des premiers, nouveau moteur).
+    """
+    global global_pool, global_engine
+    if global_pool is not None:
+        global_pool.stop()
+        global_pool = None
+    if global_engine is not None:
+        global_engine.shutdown()
+        global_engine = None
+
+def reinitialiser_precalculs():
+    """
+    Le pool et les processus du moteur dépendent de n : on les recrée quand n change.
+    """
+    global global_pool, global_engine
+    arreter_precalculs()
+    # Moteur créé avant le pool, pour ne pas forker pendant que son thread tourne
+    global_engine = creer_moteur(global_n)
+    global_pool = creer_pool(global_n)
+
 # === Fonctions IBE ===
 # --- 1. Génération des clés pour un nouvel utilisateur ---
 # Il faut avoir le nom de la table et le user_id ---> l'identité sera : la premiere lettre du nom de la table + user_id : str
@@ -58,27 +120,68 @@ def generer_cles_ibe(table_name, id_utilisateur):
 
 # --- 2. Chiffrement ---
 # Il faut avoir le message a chiffrer et le "a" du user qui va chiffrer
-def chiffrer_ibe(message: str, a: str) -> list:
+def chiffrer_ibe(message: str, a) -> dict:
     """
     Chiffre un message en utilisant 'a' et 'n_global'.
+    Mode hybride : seule la clé AES est chiffrée avec Cocks.
+    Si 'a' est une liste, le message est chiffré une seule fois pour tous les destinataires.
     """
-    a_mpz = gmpy2.mpz(a)
-    cocks = Cocks(global_n)
-    return cocks.encrypt(message.encode('utf-8'), a_mpz)
+    cocks = Cocks(global_n, global_pool)
+    if isinstance(a, list):
+        return cocks.encrypt_multi(message.encode('utf-8'), [gmpy2.mpz(x) for x in a])
+    return cocks.encrypt_hybrid(message.encode('utf-8'), gmpy2.mpz(a))
 
 # --- 3. Déchiffrement ---
 # Il faut avoir le message chiffré et le r_mpz et a_mpz
-def dechiffrer_ibe(message_chiffre: list, r: str, a: str) -> str:
+def dechiffrer_ibe(message_chiffre, r: str, a: str) -> str:
     """
     Déchiffre un message en utilisant 'r', 'a' et 'n_global'.
     """
-    r_mpz = gmpy2.mpz(r)
-    a_mpz = gmpy2.mpz(a)
-    cocks = Cocks(global_n)
-    message_clair = cocks.decrypt(message_chiffre, r_mpz, a_mpz)
+    contexte = contexte_dechiffrement(global_n, r, a)
+    message_clair = dechiffrer_message(contexte, message_chiffre)
     return message_clair.decode('utf-8')
 # Obtenir le message clair : str
 
+# Contextes de déchiffrement gardés en mémoire (LRU) par identité
+IBE_DECRYPTOR_CACHE_SIZE = int(os.getenv("IBE_DECRYPTOR_CACHE_SIZE", "1024"))
+
+@lru_cache(maxsize=IBE_DECRYPTOR_CACHE_SIZE)
+def contexte_dechiffrement(n, r: str, a: str) -> CocksDecryptor:
+    """
+    Renvoie le contexte de déchiffrement de l'identité (r, a) pour le module n.
+    Les déchiffrements répétés pour un même patient ne refont pas la préparation.
+    """
+    return CocksDecryptor(n, gmpy2.mpz(r), gmpy2.mpz(a))
+
+def serialiser_chiffre(message_chiffre) -> str:
+    """
+    Sérialise un chiffré au format binaire compact, encodé en base64 pour le JSON.
+    """
+    return b64encode(pack_ciphertext(message_chiffre, global_n)).decode()
+
+def charger_chiffre(message_chiffre_b64: str):
+    """
+    Désérialise un chiffré : format binaire, ou pickle pour les anciennes lignes.
+    """
+    donnees = b64decode(message_chiffre_b64)
+    if is_packed_ciphertext(donnees):
+        return unpack_ciphertext(donnees)
+    return pickle.loads(donnees)
+
+def dechiffrer_message(contexte: CocksDecryptor, message_chiffre) -> bytes:
+    """
+    Choisit le mode de déchiffrement à partir de la version du chiffré.
+    Les anciennes lignes (liste de tuples chiffrés bit à bit) restent lisibles.
+    """
+    if isinstance(message_chiffre, dict):
+        if message_chiffre.get('version') == VERSION_HYBRID:
+            return contexte.decrypt_hybrid(message_chiffre)
+        if message_chiffre.get('version') == VERSION_MULTI:
+            return contexte.decrypt_multi(message_chiffre)
+    if global_engine is not None and len(message_chiffre) >= IBE_PARALLEL_THRESHOLD * 8:
+        return global_engine.decrypt(message_chiffre, contexte.r, contexte.a)
+    return contexte.decrypt(message_chiffre)
+
 app = Flask(__name__)
 
 @app.route('/generer_cles', methods=['POST'])
@@ -114,12 +217,10 @@ def chiffrer():
         return jsonify({'error': 'Champs message et a requis.'}), 400
 
     try:
-        message = data['message']
-        a = gmpy2.mpz(data['a'])
-        cocks = Cocks(global_n)
-        message_chiffre = cocks.encrypt(message.encode('utf-8'), a)
+        # 'a' peut être une liste d'identités : chiffrement multi-destinataires
+        message_chiffre = chiffrer_ibe(data['message'], data['a'])
         return jsonify({
-            'message_chiffre': b64encode(pickle.dumps(message_chiffre)).decode(),  # Sérialisation pour JSON
+            'message_chiffre': serialiser_chiffre(message_chiffre),  # Sérialisation pour JSON
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -132,22 +233,78 @@ def dechiffrer():
         return jsonify({'error': 'Champs message_chiffre, r et a requis.'}), 400
 
     try:
-        message_chiffre = pickle.loads(b64decode(data['message_chiffre']))
-        r = gmpy2.mpz(data['r'])
-        a = gmpy2.mpz(data['a'])
-        cocks = Cocks(global_n)
-        message_clair = cocks.decrypt(message_chiffre, r, a)
+        message_chiffre = charger_chiffre(data['message_chiffre'])
+        contexte = contexte_dechiffrement(global_n, data['r'], data['a'])
+        message_clair = dechiffrer_message(contexte, message_chiffre)
         return jsonify({
             'message_clair': message_clair.decode('utf-8')
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# --- Déchiffrement par lot pour une même identité ---
+@app.route('/dechiffrer_lot', methods=['POST'])
+def dechiffrer_lot():
+    data = request.get_json()
+    if not data or 'messages_chiffres' not in data or 'r' not in data or 'a' not in data:
+        return jsonify({'error': 'Champs messages_chiffres, r et a requis.'}), 400
+
+    try:
+        contexte = contexte_dechiffrement(global_n, data['r'], data['a'])
+        messages_clairs = [
+            dechiffrer_message(contexte, charger_chiffre(m)).decode('utf-8')
+            for m in data['messages_chiffres']
+        ]
+        return jsonify({
+            'messages_clairs': messages_clairs
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# --- Chiffrement / déchiffrement en flux pour les gros documents ---
+# Le corps de la requête est le contenu brut (pas de JSON) ; la réponse est envoyée
+# au fur et à mesure. L'identité est passée dans les en-têtes X-IBE-A et X-IBE-R.
+TAILLE_BLOC = 64 * 1024
+
+@app.route('/chiffrer_flux', methods=['POST'])
+def chiffrer_flux():
+    a = request.headers.get('X-IBE-A')
+    if not a:
+        return jsonify({'error': 'En-tête X-IBE-A requis.'}), 400
+
+    try:
+        cocks = Cocks(global_n, global_pool)
+        blocs = iter(lambda: request.stream.read(TAILLE_BLOC), b'')
+        flux = cocks.encrypt_stream(blocs, gmpy2.mpz(a))
+        # Le premier bloc (en-tête + clé chiffrée) est calculé ici pour pouvoir renvoyer une erreur JSON
+        premier = next(flux)
+        return Response(stream_with_context(chain([premier], flux)), mimetype='application/octet-stream')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/dechiffrer_flux', methods=['POST'])
+def dechiffrer_flux():
+    r = request.headers.get('X-IBE-R')
+    a = request.headers.get('X-IBE-A')
+    if not r or not a:
+        return jsonify({'error': 'En-têtes X-IBE-R et X-IBE-A requis.'}), 400
+
+    try:
+        contexte = contexte_dechiffrement(global_n, r, a)
+        flux = contexte.decrypt_stream(request.stream, TAILLE_BLOC)
+        # Lecture de l'en-tête et de la clé avant d'envoyer la réponse
+        premier = next(flux, b'')
+        return Response(stream_with_context(chain([premier], flux)), mimetype='application/octet-stream')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/get_pkg', methods=['GET'])
 def get_pkg():
     global global_pkg, global_n
-    global_pkg = CocksPKG()  # Nouveau jeu de clés
+    arreter_precalculs()  # Le thread du pool doit être arrêté avant de forker pour la recherche des premiers
+    global_pkg = CocksPKG(workers=IBE_WORKERS or None)  # Nouveau jeu de clés, recherche des premiers en parallèle (un processus par cœur par défaut)
     global_n = global_pkg.n
+    reinitialiser_precalculs()
 
     return jsonify({
         "message": "Nouveau CocksPKG généré.",
@@ -165,10 +322,9 @@ def set_pkg():
 
     try:
         global global_pkg, global_n
-        global_pkg.p = gmpy2.mpz(data["p"])
-        global_pkg.q = gmpy2.mpz(data["q"])
-        global_pkg.n = gmpy2.mpz(data["n"])
+        global_pkg.set_params(data["p"], data["q"], data["n"])
         global_n = global_pkg.n
+        reinitialiser_precalculs()
 
         return jsonify({
             "message": "CocksPKG mis à jour.",
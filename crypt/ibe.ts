@@ -14,6 +14,10 @@ export interface DechiffrerResponse {
     message_clair: string;
 }
 
+export interface DechiffrerLotResponse {
+    messages_clairs: string[];
+}
+
 export interface PkgResponse {
     message: string;
     p: string;
@@ -32,6 +36,19 @@ async function postJSON<T>(url: string, body: any): Promise<T> {
     return res.json();
 }
 
+// Envoie un contenu brut (éventuellement un flux) et renvoie la réponse sans la lire,
+// pour que l'appelant puisse consommer res.body au fur et à mesure
+async function postStream(url: string, body: BodyInit, headers: Record<string, string>): Promise<Response> {
+    const res = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/octet-stream', ...headers },
+        body,
+        duplex: 'half'
+    } as RequestInit);
+    if (!res.ok) throw new Error(`Erreur HTTP: ${res.status}`);
+    return res;
+}
+
 async function getJSON<T>(url: string): Promise<T> {
     const res = await fetch(url);
     if (!res.ok) throw new Error(`Erreur HTTP: ${res.status}`);
@@ -49,7 +66,8 @@ export class IBE {
         });
     }
 
-    static chiffrer(message: string, a: string): Promise<ChiffrerResponse> {
+    // a peut être une liste : le message est alors lisible par chacune des identités
+    static chiffrer(message: string, a: string | string[]): Promise<ChiffrerResponse> {
         return postJSON(`${API_BASE}/chiffrer`, {
             message,
             a
@@ -64,6 +82,22 @@ export class IBE {
         });
     }
 
+    static dechiffrerLot(messagesChiffres: string[], r: string, a: string): Promise<DechiffrerLotResponse> {
+        return postJSON(`${API_BASE}/dechiffrer_lot`, {
+            messages_chiffres: messagesChiffres,
+            r,
+            a
+        });
+    }
+
+    static chiffrerFlux(contenu: BodyInit, a: string): Promise<Response> {
+        return postStream(`${API_BASE}/chiffrer_flux`, contenu, { 'X-IBE-A': a });
+    }
+
+    static dechiffrerFlux(contenuChiffre: BodyInit, r: string, a: string): Promise<Response> {
+        return postStream(`${API_BASE}/dechiffrer_flux`, contenuChiffre, { 'X-IBE-R': r, 'X-IBE-A': a });
+    }
+
     static getPkg(): Promise<PkgResponse> {
         return getJSON(`${API_BASE}/get_pkg`);
     }
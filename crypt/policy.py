@@ -0,0 +1,268 @@
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from abe import PolicyNode
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus
+    fcntl = None
+
+# Marqueur remplacé par le service (en majuscules) dans les règles dynamiques
+SERVICE = "{service}"
+
+# Règles (table, colonne) -> politique ; les colonnes absentes suivent la règle statique [TABLE]
+FIELD_RULES: Dict[Tuple[str, str], list] = {
+    ('PATIENT', 'dossier_medical'): [['MEDECIN', SERVICE]],
+    **{('prelevement', column): [['MEDECIN', SERVICE], ['INFIRMIER', SERVICE]]
+       for column in ('temperature', 'observation', 'tension_art', 'pulsation', 'tension_resp')},
+    **{('analyse_medicale', column): [['MEDECIN', SERVICE], ['LABORANTIN']]
+       for column in ('examen', 'valeur_details')},
+    **{('radio', column): [['MEDECIN', SERVICE], ['RADIOLOGUE']]
+       for column in ('type_radio', 'resultat')},
+}
+
+# Tables dont la politique statique [TABLE] est connue (staticPolicies de actions/encrypt.ts)
+STATIC_TABLES = frozenset({
+    'PATIENT', 'MEDECIN', 'AGENT', 'INFIRMIER', 'LABORANTIN', 'RADIOLOGUE', 'COMPTABLE', 'FACTURE',
+})
+
+def policy_id_of(canonical: str) -> str:
+    """Identifiant stable d'une politique : début de l'empreinte SHA-256 de sa forme canonique"""
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+@dataclass(frozen=True)
+class CompiledPolicy:
+    """Politique compilée une fois pour toutes : arbre partagé, attributs et identifiant stable"""
+    policy_id: str
+    canonical: str
+    policy_list: list = field(compare=False)
+    root: PolicyNode = field(compare=False)
+    attributes: FrozenSet[str] = field(compare=False)
+
+class PolicyCompiler:
+    """Compile les règles table/colonne/service en politiques immuables.
+
+    Les nœuds identiques sont partagés entre politiques (hash-consing) et les
+    politiques compilées sont gardées par forme canonique et par (table, colonne, service).
+    Seules les règles connues sont gardées : une table inconnue ou un service hors de
+    `services` est compilé à chaque appel, sans rien mémoriser.
+    """
+
+    def __init__(self, rules: Dict[Tuple[str, str], list] = FIELD_RULES, services: Iterable[str] = ()):
+        self.rules = rules
+        self.services = frozenset(service.upper() for service in services)
+        # Règles dont la politique dépend du service
+        self._dynamic = {key for key, rule in rules.items() if SERVICE in set(self._attributes(rule))}
+        self._nodes: Dict[tuple, PolicyNode] = {}
+        self._by_canonical: Dict[str, CompiledPolicy] = {}
+        self._by_field: Dict[Tuple[str, str, Optional[str]], CompiledPolicy] = {}
+        self._lock = threading.Lock()
+
+    def field_policy(self, table: str, column: str, service: str = None) -> list:
+        """Politique (forme liste) associée à une colonne"""
+        rule = self.rules.get((table, column))
+        if rule is None:
+            return [table.upper()]
+        return self._substitute(rule, service)
+
+    def is_known(self, table: str, column: str, service: str = None) -> bool:
+        """Vrai si la colonne relève d'une règle connue, avec un service connu si la règle
+        en dépend (seules ces politiques sont mémorisées et enregistrées)"""
+        if (table, column) in self._dynamic:
+            return bool(service) and service.upper() in self.services
+        return (table, column) in self.rules or table in STATIC_TABLES
+
+    def for_field(self, table: str, column: str, service: str = None) -> CompiledPolicy:
+        """Politique compilée d'une colonne, sans reconstruction d'arbre après le premier appel"""
+        if not self.is_known(table, column, service):
+            # Valeurs fournies par le client : compilées sans agrandir les caches
+            return self._compile(self.field_policy(table, column, service), {})
+        rule = self.rules.get((table, column))
+        # Le service ne fait partie de la clé que si la règle l'utilise
+        key = (table, column, service.upper() if rule is not None and service else None)
+        compiled = self._by_field.get(key)
+        if compiled is None:
+            compiled = self.compile(self.field_policy(table, column, service))
+            with self._lock:
+                compiled = self._by_field.setdefault(key, compiled)
+        return compiled
+
+    def compile(self, policy_list: list) -> CompiledPolicy:
+        """Compile une politique sous forme de liste : OR de groupes AND, ou AND d'attributs"""
+        canonical = json.dumps(self._normalize(policy_list), separators=(',', ':'))
+        compiled = self._by_canonical.get(canonical)
+        if compiled is not None:
+            return compiled
+
+        with self._lock:
+            compiled = self._by_canonical.get(canonical)
+            if compiled is None:
+                compiled = self._by_canonical[canonical] = self._compile(policy_list, self._nodes)
+        return compiled
+
+    def __len__(self):
+        return len(self._by_canonical)
+
+    def _compile(self, policy_list: list, nodes: Dict[tuple, PolicyNode]) -> CompiledPolicy:
+        # nodes : table de partage des nœuds (celle du compilateur, ou une table jetable)
+        canonical = json.dumps(self._normalize(policy_list), separators=(',', ':'))
+        policy_list = json.loads(canonical)
+        return CompiledPolicy(
+            policy_id=policy_id_of(canonical),
+            canonical=canonical,
+            policy_list=policy_list,
+            root=self._build(policy_list, nodes),
+            attributes=frozenset(self._attributes(policy_list)),
+        )
+
+    # === CONSTRUCTION DES ARBRES ===
+    def _build(self, element, nodes: Dict[tuple, PolicyNode]) -> PolicyNode:
+        if isinstance(element, list):
+            if any(isinstance(e, list) for e in element):
+                return self._node("OR", [self._build_group(g, nodes) for g in element], nodes)
+            return self._node("AND", [self._attr(e, nodes) for e in element], nodes)
+        return self._attr(element, nodes)
+
+    def _build_group(self, group, nodes: Dict[tuple, PolicyNode]) -> PolicyNode:
+        if isinstance(group, list):
+            return self._node("AND", [self._attr(e, nodes) for e in group], nodes)
+        return self._attr(group, nodes)
+
+    @staticmethod
+    def _attr(attribute: str, nodes: Dict[tuple, PolicyNode]) -> PolicyNode:
+        key = ("ATTR", attribute)
+        node = nodes.get(key)
+        if node is None:
+            node = nodes[key] = PolicyNode("ATTR", attribute=attribute)
+        return node
+
+    @staticmethod
+    def _node(node_type: str, children: List[PolicyNode], nodes: Dict[tuple, PolicyNode]) -> PolicyNode:
+        # Les enfants étant déjà partagés, leur identité suffit à identifier le nœud
+        key = (node_type, tuple(id(c) for c in children))
+        node = nodes.get(key)
+        if node is None:
+            node = nodes[key] = PolicyNode(node_type, children)
+        return node
+
+    @classmethod
+    def _normalize(cls, element):
+        if isinstance(element, list):
+            return [cls._normalize(e) for e in element]
+        return element.upper()
+
+    @classmethod
+    def _substitute(cls, element, service: Optional[str]):
+        if isinstance(element, list):
+            return [cls._substitute(e, service) for e in element]
+        return service.upper() if element == SERVICE else element
+
+    @classmethod
+    def _attributes(cls, element):
+        if isinstance(element, list):
+            for e in element:
+                yield from cls._attributes(e)
+        else:
+            yield element
+
+class PolicyRegistry:
+    """Registre persistant identifiant -> forme canonique des politiques.
+
+    Les chiffrés ne portent que l'identifiant ; le registre (fichier JSON)
+    permet de retrouver la politique compilée au déchiffrement. Plusieurs
+    processus peuvent le partager : les écritures sont sérialisées par un
+    verrou fcntl sur le fichier `<path>.lock`.
+    """
+
+    def __init__(self, path: str, compiler: PolicyCompiler):
+        self.path = path
+        self.compiler = compiler
+        self._canonical: Dict[str, str] = {}
+        # (inode, date de modification, taille) du fichier au dernier chargement
+        self._stamp: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Charge (ou recharge) le fichier du registre"""
+        with self._lock:
+            self._read()
+
+    def register(self, policy: CompiledPolicy) -> str:
+        """Enregistre une politique compilée et retourne son identifiant"""
+        if self._canonical.get(policy.policy_id) == policy.canonical:
+            return policy.policy_id
+        with self._lock, self._file_lock():
+            # Entrées écrites par d'autres processus depuis le dernier chargement
+            self._read()
+            known = self._canonical.get(policy.policy_id)
+            if known is not None and known != policy.canonical:
+                raise ValueError(f"Collision d'identifiant de politique: {policy.policy_id}")
+            if known is None:
+                self._canonical[policy.policy_id] = policy.canonical
+                self._write()
+        return policy.policy_id
+
+    def resolve(self, policy_id: str) -> CompiledPolicy:
+        """Politique compilée correspondant à un identifiant"""
+        canonical = self._canonical.get(policy_id)
+        if canonical is None and self._file_stamp() != self._stamp:
+            # Fichier réécrit depuis le dernier chargement (par un autre processus) ;
+            # un identifiant inconnu ne coûte sinon qu'un stat
+            self.load()
+            canonical = self._canonical.get(policy_id)
+        if canonical is None:
+            raise KeyError(f"Politique inconnue: {policy_id}")
+        compiled = self.compiler.compile(json.loads(canonical))
+        if compiled.policy_id != policy_id:
+            raise ValueError(f"Entrée du registre altérée: {policy_id}")
+        return compiled
+
+    def __len__(self):
+        return len(self._canonical)
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # os.replace crée un nouveau fichier à chaque écriture : l'inode suffit presque
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _read(self):
+        # Fusion du contenu du fichier (appelé sous self._lock)
+        stamp = self._file_stamp()
+        if stamp is None:
+            return
+        with open(self.path, encoding='utf-8') as f:
+            entries = json.load(f)
+        for policy_id, canonical in entries.items():
+            self._canonical.setdefault(policy_id, canonical)
+        self._stamp = stamp
+
+    def _write(self):
+        # Écriture atomique (fichier temporaire puis remplacement), sous le verrou de fichier
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._canonical, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._stamp = self._file_stamp()
+
+    @contextmanager
+    def _file_lock(self):
+        # Verrou exclusif entre processus pendant lecture, fusion et remplacement
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,100 @@
+"""
+Sieve-based prime search shared by the Cocks PKG and the CP-ABE setup.
+
+Candidates are taken from a window start + step * k (0 <= k < window)
+and sieved by the odd primes below SIEVE_BOUND before any primality
+test. A search task scans exactly one window and returns None on a
+miss, so a parallel search can stop as soon as enough primes are found:
+the tasks still running when it stops are single windows, not
+open-ended loops.
+"""
+
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+SIEVE_BOUND = 4096
+SIEVE_WINDOW = 8192
+
+
+def _small_primes(bound):
+    flags = bytearray([1]) * bound
+    flags[:2] = b"\x00\x00"
+    for i in range(2, int(bound ** 0.5) + 1):
+        if flags[i]:
+            flags[i * i::i] = bytes(len(range(i * i, bound, i)))
+    return [i for i in range(3, bound) if flags[i]]
+
+
+SMALL_PRIMES = _small_primes(SIEVE_BOUND)
+
+
+def sieve(start, step, forms=((1, 0),), window=SIEVE_WINDOW):
+    """
+    Yields the candidates x = start + step * k (0 <= k < window) such that
+    no small prime divides a * x + b for any (a, b) in forms.
+
+    forms=((1, 0),) keeps candidates with no small factor; adding (2, 1)
+    also sieves 2x + 1, as needed for safe primes. step and every a must
+    be powers of two (invertible modulo the odd small primes).
+    """
+    composite = bytearray(window)
+    for sp in SMALL_PRIMES:
+        for a, b in forms:
+            # a * (start + step * k) + b = 0 (mod sp)  <=>  k = -(a * start + b) / (a * step)
+            k = -(a * start + b) * pow(a * step, -1, sp) % sp
+            composite[k::sp] = b"\x01" * len(range(k, window, sp))
+    for k in range(window):
+        if not composite[k]:
+            yield start + step * k
+
+
+def fork_context():
+    """
+    Returns the "fork" multiprocessing context, or None where fork is unavailable.
+
+    Process pools created at import time by the servers must fork: with
+    spawn or forkserver (the macOS default, and the Linux default from
+    Python 3.14), every child re-imports the caller's __main__ module,
+    which starts its own pools and breaks the parent's.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def search(task, args=(), count=1, workers=1):
+    """
+    Calls task(*args) until it has returned count distinct results.
+
+    task scans one sieve window and returns a result or None. With
+    workers > 1, windows are scanned by a process pool (task must be a
+    module-level function); pending windows are cancelled once enough
+    results are in, and only the windows already running are waited for.
+
+    Returns:
+        The list of the count first distinct results
+    """
+    found = []
+    if workers <= 1:
+        while len(found) < count:
+            result = task(*args)
+            if result is not None and result not in found:
+                found.append(result)
+        return found
+
+    # Search tasks do not depend on the parent's state; fork is simply the cheapest start
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=fork_context())
+    try:
+        # Two windows queued per process so that none of them sits idle
+        pending = {executor.submit(task, *args) for _ in range(2 * workers)}
+        while len(found) < count:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is not None and result not in found and len(found) < count:
+                    found.append(result)
+            if len(found) < count:
+                pending |= {executor.submit(task, *args) for _ in done}
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    return found
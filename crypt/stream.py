@@ -0,0 +1,131 @@
+"""
+Segmented AES-GCM ("STREAM" construction) for payloads that should not be
+held in memory at once.
+
+The payload is cut into segments of SEGMENT_SIZE bytes. Each segment is
+sealed with AES-GCM under the nonce
+
+    prefix (7 bytes) || segment counter (4 bytes, big-endian) || last flag (1 byte)
+
+so segments cannot be reordered, dropped or truncated without detection.
+
+Wire format:
+    prefix (7 bytes), then for each segment:
+    frame header (4 bytes, big-endian) || ciphertext || tag (16 bytes)
+The frame header holds the ciphertext length, with its top bit set on the
+last segment. The flag is also bound into the nonce, so flipping it makes
+authentication fail.
+
+Helpful resources:
+1. V. T. Hoang, R. Reyhanitabar, P. Rogaway, D. Vizár, "Online
+   Authenticated-Encryption and its Nonce-Reuse Misuse-Resistance", CRYPTO 2015
+"""
+
+import struct
+
+from Cryptodome.Cipher import AES
+from Cryptodome.Random import get_random_bytes
+
+SEGMENT_SIZE = 64 * 1024
+PREFIX_LEN = 7
+TAG_LEN = 16
+FRAME = struct.Struct(">I")
+LAST_FLAG = 0x80000000
+MAX_COUNTER = 2 ** 32 - 1
+
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    if counter > MAX_COUNTER:
+        raise ValueError("Too many segments for a single stream")
+    return prefix + counter.to_bytes(4, 'big') + (b"\x01" if last else b"\x00")
+
+
+def _segments(chunks, segment_size):
+    """Regroups an iterable of byte chunks into segments of segment_size bytes."""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= segment_size:
+            yield bytes(buffer[:segment_size])
+            del buffer[:segment_size]
+    yield bytes(buffer)
+
+
+def encrypt_stream(key: bytes, chunks, segment_size: int = SEGMENT_SIZE):
+    """
+    Encrypts an iterable of byte chunks segment by segment.
+
+    Output is produced as soon as a segment is full: only one segment
+    (plus the one being read) is held in memory.
+
+    Yields:
+        The stream prefix, then one frame per segment
+    """
+    prefix = get_random_bytes(PREFIX_LEN)
+    yield prefix
+
+    counter = 0
+    segments = _segments(chunks, segment_size)
+    current = next(segments)
+    for following in segments:
+        yield _seal(key, prefix, counter, current, last=False)
+        counter += 1
+        current = following
+    yield _seal(key, prefix, counter, current, last=True)
+
+
+def _seal(key: bytes, prefix: bytes, counter: int, segment: bytes, last: bool) -> bytes:
+    cipher = AES.new(key, AES.MODE_GCM, nonce=_nonce(prefix, counter, last))
+    ciphertext, tag = cipher.encrypt_and_digest(segment)
+    header = len(ciphertext) | (LAST_FLAG if last else 0)
+    return FRAME.pack(header) + ciphertext + tag
+
+
+def read_exact(stream, size: int) -> bytes:
+    """Reads exactly size bytes from a file-like object (fewer only at end of stream)."""
+    data = stream.read(size)
+    while len(data) < size:
+        more = stream.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def decrypt_stream(key: bytes, stream, max_segment_size: int = SEGMENT_SIZE):
+    """
+    Decrypts a stream produced by encrypt_stream, read from a file-like object.
+
+    Each segment is authenticated before its plaintext is yielded. A
+    ValueError is raised on a corrupted or truncated stream.
+
+    Yields:
+        Plaintext segments
+    """
+    prefix = read_exact(stream, PREFIX_LEN)
+    if len(prefix) != PREFIX_LEN:
+        raise ValueError("Truncated stream")
+
+    counter = 0
+    while True:
+        header = read_exact(stream, FRAME.size)
+        if len(header) != FRAME.size:
+            raise ValueError("Truncated stream: final segment missing")
+        (header,) = FRAME.unpack(header)
+        last = bool(header & LAST_FLAG)
+        length = header & ~LAST_FLAG
+        if length > max_segment_size:
+            raise ValueError("Segment larger than the maximum segment size")
+        frame = read_exact(stream, length + TAG_LEN)
+        if len(frame) != length + TAG_LEN:
+            raise ValueError("Truncated stream")
+
+        cipher = AES.new(key, AES.MODE_GCM, nonce=_nonce(prefix, counter, last))
+        try:
+            plaintext = cipher.decrypt_and_verify(frame[:length], frame[length:])
+        except ValueError as e:
+            raise ValueError("Segment authentication failed: wrong key or corrupted stream") from e
+        yield plaintext
+        if last:
+            return
+        counter += 1
@@ -0,0 +1,134 @@
+"""
+Parity tests for the arithmetic backends of arith.py.
+
+Every available backend is checked against Python's built-in arithmetic,
+and keys and ciphertexts produced under one backend must decrypt under
+the other. The gmpy2 cases are skipped when gmpy2 is not installed.
+
+Usage:
+    python -m pytest test_arith.py
+"""
+
+import random
+
+import pytest
+
+import arith
+from abe import CPABE, FixedBase, PolicyNode
+
+requires_gmpy2 = pytest.mark.skipif(arith.gmpy2 is None, reason="gmpy2 is not installed")
+
+BACKENDS = [
+    pytest.param("gmpy2", marks=requires_gmpy2),
+    "python",
+]
+
+
+@pytest.fixture(autouse=True)
+def restore_backend():
+    """Restores the backend selected at import time after each test."""
+    default = arith.BACKEND
+    yield
+    arith.use_backend(default)
+
+
+@pytest.fixture(scope="module")
+def params():
+    """Small CP-ABE parameters, generated once for the whole module."""
+    cpabe = CPABE(128)
+    return cpabe.p, cpabe.q, cpabe.g
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1)
+
+
+@pytest.fixture
+def policy():
+    return PolicyNode("THRESHOLD", threshold=(2, 3), children=[
+        PolicyNode("ATTR", attribute=a) for a in ("MEDECIN", "CARDIO", "INFIRMIER")])
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_powmod(backend, params, rng):
+    arith.use_backend(backend)
+    p, q, g = params
+    for _ in range(32):
+        e = rng.randrange(0, q)
+        result = arith.powmod(g, e, p)
+        assert type(result) is int
+        assert result == pow(g, e, p)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_invert(backend, params, rng):
+    arith.use_backend(backend)
+    _, q, _ = params
+    for _ in range(32):
+        a = rng.randrange(1, q)
+        result = arith.invert(a, q)
+        assert type(result) is int
+        assert result == pow(a, -1, q)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_invert_not_invertible(backend, params):
+    arith.use_backend(backend)
+    _, q, _ = params
+    with pytest.raises(ValueError):
+        arith.invert(0, q)
+    with pytest.raises(ValueError):
+        arith.invert(6, 9)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("size", [0, 1, 2, 8])
+def test_batch_inverse(backend, size, params, rng):
+    arith.use_backend(backend)
+    _, q, _ = params
+    values = [rng.randrange(1, q) for _ in range(size)]
+    assert arith.batch_inverse(values, q) == [pow(v, -1, q) for v in values]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_fixed_base(backend, params, rng):
+    arith.use_backend(backend)
+    p, q, g = params
+    base = FixedBase(g, p, q)
+    for e in [0, 1, q - 1, q, q + 5] + [rng.randrange(0, q) for _ in range(32)]:
+        result = base.pow(e)
+        assert type(result) is int
+        assert result == pow(g, e % q, p)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_is_prime(backend, params):
+    arith.use_backend(backend)
+    p, q, _ = params
+    assert arith.is_prime(p) and arith.is_prime(q)
+    assert not arith.is_prime(p * q)
+    assert not arith.is_prime(q + 1)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        arith.use_backend("openssl")
+
+
+@requires_gmpy2
+@pytest.mark.parametrize("source, target", [("gmpy2", "python"), ("python", "gmpy2")])
+def test_cross_backend_decrypt(source, target, params, policy):
+    p, q, g = params
+    arith.use_backend(source)
+    cpabe = CPABE.from_params(p, q, g)
+    mpk, msk = cpabe.setup()
+    mpk.precompute()
+    sk = cpabe.keygen(mpk, msk, ["MEDECIN", "INFIRMIER"])
+    ciphertext = cpabe.encrypt(mpk, b"parity", policy)
+
+    arith.use_backend(target)
+    # Tables rebuilt so that they hold the target backend's own type
+    mpk.precompute()
+    assert cpabe.decrypt(mpk, sk, ciphertext) == b"parity"
+    assert cpabe.decrypt(mpk, cpabe.keygen(mpk, msk, ["CARDIO", "INFIRMIER"]), ciphertext) == b"parity"
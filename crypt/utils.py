@@ -61,10 +61,53 @@ def mpz_to_str(x):
 
 
 def hash_mpz(a, f):
-    a = mpz_to_hex(a)
-    a = f(bytes(a, "utf-8")).hexdigest()
-    a = hex_to_mpz(a)
-    return a
+    """
+    Hash a gmpy2.mpz integer through its hexadecimal representation.
+
+    Equivalent to hex_to_mpz(f(mpz_to_hex(a)).hexdigest()), without
+    the intermediate hex strings on the output side.
+
+    Args:
+        a (mpz): The input integer.
+        f: Hash function (e.g. hashlib.sha512).
+
+    Returns:
+        mpz: The digest interpreted as a big-endian integer.
+    """
+    digest = f(gmpy2.digits(a, 16).encode("utf-8")).digest()
+    return gmpy2.mpz(int.from_bytes(digest, byteorder='big'))
+
+
+def batch_invert(values, n):
+    """
+    Inverts every value modulo n using a single modular inversion.
+
+    This is Montgomery's simultaneous inversion trick: the running
+    products of the values are inverted once, and each individual
+    inverse is recovered with about 3 multiplications.
+
+    Args:
+        values (list): Values coprime to n.
+        n (mpz): The modulus.
+
+    Returns:
+        list: The inverses modulo n, in the same order as values.
+    """
+    if not values:
+        return []
+
+    # prefix[i] = values[0] * ... * values[i] mod n
+    prefix = [values[0]]
+    for v in values[1:]:
+        prefix.append(prefix[-1] * v % n)
+
+    inv = gmpy2.invert(prefix[-1], n)
+    inverses = [None] * len(values)
+    for i in range(len(values) - 1, 0, -1):
+        inverses[i] = inv * prefix[i - 1] % n
+        inv = inv * values[i] % n
+    inverses[0] = inv
+    return inverses
 
 
 class DecryptionFailure(Exception):